@@ -134,7 +134,112 @@ st.markdown("""
 @st.cache_resource
 def cargar_recomendador():
     ruta_csv = os.path.join(os.path.dirname(__file__), 'data', 'movies.csv')
-    return RecomendadorPeliculas(ruta_csv)
+    ruta_artefactos = os.path.join(os.path.dirname(__file__), 'artefactos')
+    return RecomendadorPeliculas(ruta_csv, ruta_artefactos=ruta_artefactos)
+
+def mostrar_metricas(recomendador):
+    metricas = recomendador.exportar_metricas()
+    
+    st.subheader("⏱️ Etapas de construcción")
+    etapas = metricas['temporizadores'].get('etapa', {})
+    if etapas:
+        st.dataframe(pd.DataFrame.from_dict(etapas, orient='index'), use_container_width=True)
+    
+    st.subheader("🚀 Métodos públicos")
+    operaciones = metricas['temporizadores'].get('operacion', {})
+    if operaciones:
+        df_operaciones = pd.DataFrame.from_dict(operaciones, orient='index').sort_values('suma_s', ascending=False)
+        st.dataframe(df_operaciones, use_container_width=True)
+    else:
+        st.info("Todavía no se ha llamado a ningún método")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("🔎 Coincidencias de título")
+        coincidencias = metricas['contadores'].get('coincidencias_titulo', {})
+        if coincidencias:
+            df_coincidencias = pd.DataFrame(list(coincidencias.items()), columns=['Tipo', 'Búsquedas'])
+            st.plotly_chart(px.bar(df_coincidencias, x='Tipo', y='Búsquedas'), use_container_width=True)
+    with col2:
+        st.subheader("💾 Memoria del modelo")
+        memoria = metricas['medidores'].get('memoria_bytes', {})
+        df_memoria = pd.DataFrame(
+            [(nombre, round(valor / 2**20, 3)) for nombre, valor in memoria.items()], columns=['Arreglo', 'MiB']
+        )
+        st.dataframe(df_memoria, use_container_width=True, hide_index=True)
+        st.json(metricas['medidores'].get('catalogo', {}))
+    
+    with st.expander("Formato Prometheus"):
+        st.code(recomendador.exportar_metricas('prometheus'), language='text')
+
+ORDENES_BUSQUEDA = {
+    "⭐ Rating (mayor a menor)": ('rating', True),
+    "⭐ Rating (menor a mayor)": ('rating', False),
+    "📅 Año (más recientes)": ('year', True),
+    "📅 Año (más antiguas)": ('year', False),
+    "🔤 Título (A-Z)": ('title', False),
+    "🔤 Título (Z-A)": ('title', True),
+}
+
+def mostrar_resultados_paginados(recomendador, filtros):
+    # Solo se piden al recomendador las filas de la página visible, así que el coste de pintar
+    # no depende de cuántas películas coincidan
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        orden = st.selectbox("Ordenar por:", list(ORDENES_BUSQUEDA), key='orden_resultados')
+    with col2:
+        tamano_pagina = st.selectbox("Por página:", [25, 50, 100], key='tamano_pagina_resultados')
+    
+    ordenar_por, descendente = ORDENES_BUSQUEDA[orden]
+    
+    def leer_pagina(pagina):
+        return recomendador.filtrar_pagina(
+            **filtros, ordenar_por=ordenar_por, descendente=descendente,
+            pagina=pagina - 1, tamano_pagina=tamano_pagina
+        )
+    
+    pagina = st.session_state.get('pagina_resultados', 1)
+    total, resultados = leer_pagina(pagina)
+    num_paginas = max((total + tamano_pagina - 1) // tamano_pagina, 1)
+    if pagina > num_paginas:
+        # Al agrandar la página puede que la actual ya no exista
+        pagina = num_paginas
+        total, resultados = leer_pagina(pagina)
+    st.session_state['pagina_resultados'] = pagina
+    with col3:
+        st.number_input(
+            f"Página (de {num_paginas}):", min_value=1, max_value=num_paginas, step=1, key='pagina_resultados'
+        )
+    
+    st.success(f"✅ Se encontraron {total} películas")
+    if total == 0:
+        return
+    
+    primera = (pagina - 1) * tamano_pagina + 1
+    st.caption(f"Mostrando {primera}-{primera + len(resultados) - 1} de {total}")
+    st.dataframe(
+        resultados[['title', 'year', 'rating', 'director', 'genre', 'country']],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'title': 'Título', 'year': st.column_config.NumberColumn('Año', format='%d'),
+            'rating': st.column_config.NumberColumn('Rating', format='%.1f'),
+            'director': 'Director', 'genre': 'Género', 'country': 'País'
+        }
+    )
+    
+    # Los detalles se cargan solo para la película elegida
+    titulos = resultados['title'].tolist()
+    elegida = st.selectbox("🎬 Ver detalles de:", range(len(titulos)), format_func=lambda i: titulos[i],
+                           index=None, placeholder="Elige una película de esta página")
+    if elegida is not None:
+        pelicula = resultados.iloc[elegida]
+        st.markdown(f"### 🎬 {pelicula['title']} ({pelicula['year']}) - ⭐ {pelicula['rating']:.1f}/10")
+        st.write(f"**Director:** {pelicula['director']}")
+        st.write(f"**Género:** {pelicula['genre']}")
+        st.write(f"**Reparto:** {pelicula['cast']}")
+        st.write(f"**País:** {pelicula['country']}")
+        st.write(f"**Sinopsis:** {pelicula['description']}")
 
 def main():
     st.markdown('<h1 class="main-header">🎬 IA Recomendadora de Películas</h1>', unsafe_allow_html=True)
@@ -144,10 +249,11 @@ def main():
     
     with st.sidebar:
         st.header("🎯 Navegación")
-        pagina = st.radio(
-            "Selecciona una opción:",
-            ["🏠 Recomendaciones", "📊 Estadísticas", "🔍 Búsqueda Avanzada", "⚖️ Comparar Películas"]
-        )
+        paginas = ["🏠 Recomendaciones", "📊 Estadísticas", "🔍 Búsqueda Avanzada", "⚖️ Comparar Películas"]
+        # Página oculta: solo aparece al abrir la app con ?diagnostico=1
+        if getattr(st, 'query_params', {}).get('diagnostico') == '1':
+            paginas.append("🩺 Diagnóstico")
+        pagina = st.radio("Selecciona una opción:", paginas)
         st.markdown("---")
         st.info("💡 **Tip**: Escribe el nombre completo o parcial de una película para obtener recomendaciones")
     
@@ -261,22 +367,25 @@ def main():
             )
             st.plotly_chart(fig_directores, use_container_width=True)
         
+        # Los histogramas vienen ya agregados en las estadísticas; no se recorre el catálogo
         st.subheader("⭐ Distribución de Ratings")
-        fig_ratings = px.histogram(
-            recomendador.df,
-            x='rating',
-            nbins=20,
-            labels={'rating': 'Rating', 'count': 'Cantidad de Películas'},
+        histograma = estadisticas['histograma_ratings']
+        bordes = histograma['bordes']
+        fig_ratings = px.bar(
+            x=[(inicio + fin) / 2 for inicio, fin in zip(bordes[:-1], bordes[1:])],
+            y=histograma['conteos'],
+            labels={'x': 'Rating', 'y': 'Cantidad de Películas'},
             color_discrete_sequence=['#667eea']
         )
-        fig_ratings.update_layout(showlegend=False)
+        fig_ratings.update_traces(width=bordes[1] - bordes[0])
+        fig_ratings.update_layout(showlegend=False, bargap=0.05)
         st.plotly_chart(fig_ratings, use_container_width=True)
         
         st.subheader("📅 Películas por Año")
-        conteos_anio = recomendador.df['year'].value_counts().sort_index()
+        conteos_anio = estadisticas['peliculas_por_anio']
         fig_anios = px.line(
-            x=conteos_anio.index,
-            y=conteos_anio.values,
+            x=list(conteos_anio.keys()),
+            y=list(conteos_anio.values()),
             labels={'x': 'Año', 'y': 'Cantidad de Películas'},
             markers=True
         )
@@ -291,70 +400,36 @@ def main():
             ["🎭 Género", "🎬 Director", "📅 Año", "⭐ Rating"]
         )
         
+        filtros = None
         if tipo_busqueda == "🎭 Género":
-            todos_generos = set()
-            for generos in recomendador.df['genre'].dropna():
-                todos_generos.update(generos.split('/'))
-            genero_seleccionado = st.selectbox("Selecciona un género:", sorted(todos_generos))
-            
+            genero_seleccionado = st.selectbox("Selecciona un género:", recomendador.listar_generos())
             if st.button("🔍 Buscar"):
-                resultados = recomendador.obtener_peliculas_por_genero(genero_seleccionado)
-                st.success(f"✅ Se encontraron {len(resultados)} películas")
-                
-                for idx, pelicula in resultados.iterrows():
-                    with st.expander(f"🎬 {pelicula['title']} ({pelicula['year']}) - ⭐ {pelicula['rating']}/10"):
-                        st.write(f"**Director:** {pelicula['director']}")
-                        st.write(f"**Género:** {pelicula['genre']}")
-                        st.write(f"**Sinopsis:** {pelicula['description']}")
+                filtros = {'genero': genero_seleccionado}
         
         elif tipo_busqueda == "🎬 Director":
-            todos_directores = sorted(recomendador.df['director'].dropna().unique())
-            director_seleccionado = st.selectbox("Selecciona un director:", todos_directores)
-            
+            director_seleccionado = st.selectbox("Selecciona un director:", recomendador.listar_directores())
             if st.button("🔍 Buscar"):
-                resultados = recomendador.obtener_peliculas_por_director(director_seleccionado)
-                st.success(f"✅ Se encontraron {len(resultados)} películas")
-                
-                for idx, pelicula in resultados.iterrows():
-                    with st.expander(f"🎬 {pelicula['title']} ({pelicula['year']}) - ⭐ {pelicula['rating']}/10"):
-                        st.write(f"**Género:** {pelicula['genre']}")
-                        st.write(f"**Sinopsis:** {pelicula['description']}")
+                filtros = {'director': director_seleccionado}
         
         elif tipo_busqueda == "📅 Año":
-            anio_min = int(recomendador.df['year'].min())
-            anio_max = int(recomendador.df['year'].max())
+            anio_min, anio_max = recomendador.limites_facetas()['anios']
             rango_anios = st.slider("Rango de años:", anio_min, anio_max, (anio_min, anio_max))
-            
             if st.button("🔍 Buscar"):
-                resultados = recomendador.df[
-                    (recomendador.df['year'] >= rango_anios[0]) & 
-                    (recomendador.df['year'] <= rango_anios[1])
-                ]
-                st.success(f"✅ Se encontraron {len(resultados)} películas")
-                
-                resultados_ordenados = resultados.sort_values('rating', ascending=False)
-                for idx, pelicula in resultados_ordenados.iterrows():
-                    with st.expander(f"🎬 {pelicula['title']} ({pelicula['year']}) - ⭐ {pelicula['rating']}/10"):
-                        st.write(f"**Director:** {pelicula['director']}")
-                        st.write(f"**Género:** {pelicula['genre']}")
+                filtros = {'anios': rango_anios}
         
         elif tipo_busqueda == "⭐ Rating":
-            rating_min = float(recomendador.df['rating'].min())
-            rating_max = float(recomendador.df['rating'].max())
+            rating_min, rating_max = recomendador.limites_facetas()['rating']
             rango_rating = st.slider("Rango de rating:", rating_min, rating_max, (7.0, rating_max), 0.1)
-            
             if st.button("🔍 Buscar"):
-                resultados = recomendador.df[
-                    (recomendador.df['rating'] >= rango_rating[0]) & 
-                    (recomendador.df['rating'] <= rango_rating[1])
-                ]
-                st.success(f"✅ Se encontraron {len(resultados)} películas")
-                
-                resultados_ordenados = resultados.sort_values('rating', ascending=False)
-                for idx, pelicula in resultados_ordenados.iterrows():
-                    with st.expander(f"🎬 {pelicula['title']} ({pelicula['year']}) - ⭐ {pelicula['rating']}/10"):
-                        st.write(f"**Director:** {pelicula['director']}")
-                        st.write(f"**Género:** {pelicula['genre']}")
+                filtros = {'rating': rango_rating}
+        
+        # La búsqueda se guarda en la sesión para que cambiar de página u orden no la pierda
+        if filtros is not None:
+            st.session_state['busqueda_avanzada'] = (tipo_busqueda, filtros)
+            st.session_state['pagina_resultados'] = 1
+        busqueda = st.session_state.get('busqueda_avanzada')
+        if busqueda is not None and busqueda[0] == tipo_busqueda:
+            mostrar_resultados_paginados(recomendador, busqueda[1])
     
     elif pagina == "⚖️ Comparar Películas":
         st.header("⚖️ Comparar Películas")
@@ -410,6 +485,48 @@ def main():
                         st.error("❌ No se pudieron encontrar una o ambas películas")
             else:
                 st.warning("⚠️ Por favor, ingresa ambas películas")
+        
+        st.markdown("---")
+        st.subheader("🧮 Comparar Varias Películas")
+        lista_titulos = st.text_area("🎬 Una película por línea:", placeholder="El Padrino\nGoodfellas\nMatrix")
+        
+        if st.button("🧮 Comparar todas", use_container_width=True):
+            titulos = [titulo.strip() for titulo in lista_titulos.splitlines() if titulo.strip()]
+            if len(titulos) >= 2:
+                with st.spinner("🔄 Comparando películas..."):
+                    resultado = recomendador.comparar_multiples(titulos)
+                
+                if resultado['no_encontrados']:
+                    st.warning(f"⚠️ No se encontraron: {', '.join(resultado['no_encontrados'])}")
+                nombres = [pelicula['title'] for pelicula in resultado['peliculas']]
+                if len(nombres) >= 2:
+                    fig = px.imshow(
+                        resultado['similitud'], x=nombres, y=nombres, text_auto=True,
+                        color_continuous_scale='Viridis', title='Similitud (%)'
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.markdown("**⭐ Diferencia de Rating**")
+                        st.dataframe(pd.DataFrame(resultado['diferencia_rating'], index=nombres, columns=nombres))
+                    with col2:
+                        st.markdown("**📅 Diferencia de Años**")
+                        st.dataframe(pd.DataFrame(resultado['diferencia_anios'], index=nombres, columns=nombres))
+                else:
+                    st.error("❌ Se necesitan al menos dos películas encontradas")
+            else:
+                st.warning("⚠️ Ingresa al menos dos películas")
+    
+    elif pagina == "🩺 Diagnóstico":
+        st.header("🩺 Diagnóstico del Recomendador")
+        
+        en_vivo = st.checkbox("Actualizar cada 2 segundos", value=False)
+        if en_vivo and hasattr(st, 'fragment'):
+            st.fragment(run_every=2)(mostrar_metricas)(recomendador)
+        else:
+            st.button("🔄 Actualizar")
+            mostrar_metricas(recomendador)
 
 if __name__ == "__main__":
     main()
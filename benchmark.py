@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+COLUMNAS = ['title', 'genre', 'year', 'director', 'rating', 'description', 'cast', 'country']
+
+# Cada tamaño se mide en un intérprete nuevo para que el pico de memoria sea solo el de ese catálogo
+CODIGO_MEDICION = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import benchmark
+print(json.dumps(benchmark.medir_catalogo(sys.argv[2], json.loads(sys.argv[3]))))
+"""
+
+
+def _vocabulario(ruta_csv):
+    # Los valores del catálogo real dan el vocabulario; los nombres se recombinan para tener
+    # tantos directores y actores distintos como pida el tamaño
+    import pandas as pd
+
+    df = pd.read_csv(ruta_csv)
+    palabras = sorted({palabra.strip('.,;:"\'()').lower() for texto in df['description'].dropna() for palabra in texto.split()} - {''})
+    nombres = sorted({nombre.strip() for reparto in df['cast'].dropna() for nombre in reparto.split(',')} | set(df['director'].dropna()))
+    nombres_pila = sorted({nombre.split()[0] for nombre in nombres})
+    apellidos = sorted({nombre.split()[-1] for nombre in nombres if len(nombre.split()) > 1})
+    generos = sorted({parte for genero in df['genre'].dropna() for parte in genero.split('/')})
+    return {
+        'palabras': np.array(palabras, dtype=object),
+        'nombres_pila': np.array(nombres_pila, dtype=object),
+        'apellidos': np.array(apellidos, dtype=object),
+        'generos': np.array(generos, dtype=object),
+        'paises': df['country'].dropna().unique().astype(object),
+    }
+
+
+def _unir(*columnas, separador=' '):
+    resultado = columnas[0]
+    for columna in columnas[1:]:
+        resultado = resultado + separador + columna
+    return resultado
+
+
+def generar_catalogo(num_filas, semilla=0, ruta_referencia=None):
+    # Catálogo sintético con el esquema de data/movies.csv. Las distribuciones imitan las reales:
+    # pocos géneros y países, un director cada ~20 películas y ratings concentrados entre 6 y 9
+    import pandas as pd
+
+    generador = np.random.default_rng(semilla)
+    vocabulario = _vocabulario(ruta_referencia or os.path.join(DIRECTORIO, 'data', 'movies.csv'))
+    palabras = vocabulario['palabras']
+
+    def elegir(valores, cantidad=num_filas):
+        return valores[generador.integers(0, len(valores), cantidad)]
+
+    def nombres(cantidad):
+        return _unir(elegir(vocabulario['nombres_pila'], cantidad), elegir(vocabulario['apellidos'], cantidad))
+
+    titulos = _unir(*(np.char.capitalize(elegir(palabras).astype(str)).astype(object) for _ in range(3)))
+    # Un sufijo numérico en parte de los títulos evita que casi todos se repitan en catálogos grandes
+    secuela = generador.random(num_filas) < 0.3
+    titulos[secuela] = titulos[secuela] + ' ' + generador.integers(2, 10, secuela.sum()).astype(str).astype(object)
+
+    generos = elegir(vocabulario['generos'])
+    dobles = generador.random(num_filas) < 0.7
+    generos[dobles] = _unir(generos[dobles], elegir(vocabulario['generos'], dobles.sum()), separador='/')
+
+    directores = nombres(max(num_filas // 20, 1))
+    reparto = _unir(*(nombres(num_filas) for _ in range(4)), separador=', ')
+    longitud = 12
+    descripciones = _unir(*(elegir(palabras) for _ in range(longitud)))
+    descripciones = np.char.capitalize(descripciones.astype(str)).astype(object)
+
+    return pd.DataFrame({
+        'title': titulos,
+        'genre': generos,
+        'year': generador.integers(1920, 2025, num_filas),
+        'director': elegir(directores),
+        'rating': np.clip(np.round(generador.normal(7.2, 0.9, num_filas), 1), 1.0, 10.0),
+        'description': descripciones,
+        'cast': reparto,
+        'country': elegir(vocabulario['paises']),
+    }, columns=COLUMNAS)
+
+
+def _percentiles(duraciones):
+    milisegundos = np.array(duraciones, dtype=np.float64) * 1000
+    p50, p99 = np.percentile(milisegundos, [50, 99])
+    return {
+        'consultas': len(milisegundos),
+        'p50_ms': round(float(p50), 4),
+        'p99_ms': round(float(p99), 4),
+        'media_ms': round(float(milisegundos.mean()), 4),
+    }
+
+
+def _cronometrar(funcion, argumentos):
+    duraciones = []
+    for argumento in argumentos:
+        inicio = time.perf_counter()
+        funcion(*argumento)
+        duraciones.append(time.perf_counter() - inicio)
+    return _percentiles(duraciones)
+
+
+def medir_catalogo(ruta_csv, opciones):
+    from movie_recommender import RecomendadorPeliculas, _rss_pico_bytes
+
+    rss_inicial = _rss_pico_bytes()
+    inicio = time.perf_counter()
+    recomendador = RecomendadorPeliculas(
+        ruta_csv, num_vecinos=opciones['num_vecinos'], procesos=opciones['procesos'],
+        motor=opciones['motor'], dimension_lsa=opciones['dimension_lsa'],
+        listas_ivf=opciones['listas_ivf'], sondas_ivf=opciones['sondas_ivf'],
+        # Se mide el cálculo de cada consulta, no la caché de resultados
+        cache=False
+    )
+    construccion = time.perf_counter() - inicio
+    rss_construccion = _rss_pico_bytes()
+
+    generador = np.random.default_rng(opciones['semilla'])
+    df = recomendador.df
+    consultas = opciones['consultas']
+    filas = generador.integers(0, len(df), consultas)
+    otras = generador.integers(0, len(df), consultas)
+    titulos = df['title'].to_numpy(dtype=object)
+    # Erratas: se intercambian dos letras del título para forzar la búsqueda aproximada
+    erratas = []
+    for titulo in titulos[filas]:
+        posicion = max(len(titulo) // 2, 1)
+        erratas.append(titulo[:posicion - 1] + titulo[posicion:posicion + 1] + titulo[posicion - 1:posicion] + titulo[posicion + 1:])
+    generos = [genero.split('/')[0] for genero in df['genre'].to_numpy(dtype=object)[filas]]
+    directores = df['director'].to_numpy(dtype=object)[filas]
+
+    latencias = {
+        'buscar_pelicula': _cronometrar(recomendador.buscar_pelicula, [(titulo,) for titulo in titulos[filas]]),
+        'buscar_pelicula_aproximada': _cronometrar(recomendador.buscar_pelicula, [(titulo,) for titulo in erratas]),
+        'recomendar_peliculas': _cronometrar(
+            recomendador.recomendar_peliculas, [(titulo, 5) for titulo in titulos[filas]]
+        ),
+        'comparar_peliculas': _cronometrar(
+            recomendador.comparar_peliculas, list(zip(titulos[filas], titulos[otras]))
+        ),
+        'obtener_estadisticas': _cronometrar(recomendador.obtener_estadisticas, [()] * max(consultas // 10, 1)),
+        'obtener_peliculas_por_genero': _cronometrar(recomendador.obtener_peliculas_por_genero, [(genero,) for genero in generos]),
+        'obtener_peliculas_por_director': _cronometrar(
+            recomendador.obtener_peliculas_por_director, [(director,) for director in directores]
+        ),
+    }
+
+    # Con un motor aproximado se informa además del recall@k frente a TF-IDF exacto y de la memoria de cada uno;
+    # con IVF también frente a la búsqueda exacta sobre los mismos vectores LSA, que aísla el error del índice
+    evaluacion = evaluacion_ann = None
+    if opciones['motor'] != 'tfidf':
+        evaluacion = recomendador.evaluar_motor(
+            opciones['motor'], k=10, muestras=min(consultas, 200), semilla=opciones['semilla']
+        )
+    if opciones['motor'] == 'ivf':
+        evaluacion_ann = recomendador.evaluar_motor(
+            'ivf', k=10, muestras=min(consultas, 200), semilla=opciones['semilla'], referencia='lsa'
+        )
+
+    rss_final = _rss_pico_bytes()
+    return {
+        'filas': len(df),
+        'evaluacion_motor': evaluacion,
+        'evaluacion_ann': evaluacion_ann,
+        'construccion_s': round(construccion, 3),
+        'rss_pico_bytes': rss_final,
+        'aumento_rss_construccion_bytes': None if rss_inicial is None else rss_construccion - rss_inicial,
+        'estadisticas_carga': recomendador.estadisticas_carga,
+        'latencias': latencias,
+    }
+
+
+def _commit_actual():
+    try:
+        resultado = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return resultado.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mide construcción, memoria y latencias sobre catálogos sintéticos')
+    parser.add_argument('--tamanos', default='1000,10000,100000',
+                        help='tamaños separados por comas, p. ej. 1000,10000,100000,1000000')
+    parser.add_argument('--num-vecinos', type=int, default=20,
+                        help='0 usa la matriz densa N×N (solo viable en catálogos pequeños)')
+    parser.add_argument('--procesos', type=int, default=None)
+    parser.add_argument('--motor', choices=['tfidf', 'lsa', 'ivf', 'campos'], default='tfidf')
+    parser.add_argument('--dimension-lsa', type=int, default=128)
+    parser.add_argument('--listas-ivf', type=int, default=None, help='por defecto, ~4·√N')
+    parser.add_argument('--sondas-ivf', type=int, default=16)
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default=None, help='archivo JSON de resultados (por defecto, la salida estándar)')
+    parser.add_argument('--guardar-catalogos', default=None, help='directorio donde conservar los CSV generados')
+    args = parser.parse_args()
+
+    opciones = {
+        'num_vecinos': args.num_vecinos or None,
+        'procesos': args.procesos,
+        'motor': args.motor,
+        'dimension_lsa': args.dimension_lsa,
+        'listas_ivf': args.listas_ivf,
+        'sondas_ivf': args.sondas_ivf,
+        'consultas': args.consultas,
+        'semilla': args.semilla,
+    }
+    resultados = []
+    with tempfile.TemporaryDirectory() as temporal:
+        directorio = args.guardar_catalogos or temporal
+        os.makedirs(directorio, exist_ok=True)
+        for tamano in (int(valor) for valor in args.tamanos.split(',') if valor.strip()):
+            ruta_csv = os.path.join(directorio, f'catalogo_{tamano}.csv')
+            inicio = time.perf_counter()
+            generar_catalogo(tamano, semilla=args.semilla).to_csv(ruta_csv, index=False)
+            generacion = time.perf_counter() - inicio
+            print(f'{tamano} filas: catálogo generado en {generacion:.1f}s, midiendo...', file=sys.stderr, flush=True)
+
+            proceso = subprocess.run(
+                [sys.executable, '-c', CODIGO_MEDICION, DIRECTORIO, ruta_csv, json.dumps(opciones)],
+                cwd=DIRECTORIO, capture_output=True, text=True
+            )
+            if proceso.returncode != 0:
+                resultados.append({'filas': tamano, 'error': proceso.stderr.strip().splitlines()[-1:]})
+                continue
+            medidas = json.loads(proceso.stdout.strip().splitlines()[-1])
+            medidas['generacion_s'] = round(generacion, 3)
+            resultados.append(medidas)
+
+    informe = {
+        'commit': _commit_actual(),
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'opciones': opciones,
+        'resultados': resultados,
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from indice_titulos import normalizar_titulo
+
+# Las entradas más grandes que esto (en bytes serializados) no se guardan: p. ej. un filtro que
+# devuelve medio catálogo costaría más guardarlo que recalcularlo
+TAMANO_MAXIMO_ENTRADA = 1 << 20
+# Cada cuántas escrituras se purga la capa en disco
+PURGA_CADA = 128
+
+
+# Parámetros que se buscan normalizados (títulos y valores de facetas); el resto, como opciones o
+# listas de títulos cuyo resultado los repite, entran en la clave tal como se pasaron
+PARAMETROS_TEXTO = ('genero', 'director', 'pais')
+
+
+def _es_texto_buscado(nombre):
+    return nombre in PARAMETROS_TEXTO or nombre.startswith('titulo_pelicula')
+
+
+def _normalizar(valor, texto=False):
+    # Convierte argumentos equivalentes en la misma clave: con `texto`, cadenas como las normalizan los
+    # índices ("Matrix!" y "matrix"); listas y conjuntos en tuplas, diccionarios ordenados por clave.
+    # Una cadena que se normaliza a '' (p. ej. solo caracteres no latinos) se deja como está.
+    if isinstance(valor, str):
+        return (normalizar_titulo(valor) or valor) if texto else valor
+    if isinstance(valor, dict):
+        return tuple(sorted((str(clave), _normalizar(dato, texto)) for clave, dato in valor.items()))
+    if isinstance(valor, (set, frozenset)):
+        return tuple(sorted(_normalizar(dato, texto) for dato in valor))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_normalizar(dato, texto) for dato in valor)
+    if hasattr(valor, 'item') and getattr(valor, 'ndim', None) == 0:
+        return valor.item()
+    if hasattr(valor, 'tolist'):
+        return _normalizar(valor.tolist(), texto)
+    return valor
+
+
+class _CapaDisco:
+    # SQLite en modo WAL: varios procesos de la misma máquina leen y escriben el mismo archivo.
+    # Se acota por número de entradas y se purga por antigüedad de escritura (FIFO), no por uso,
+    # para que una lectura no tenga que escribir.
+
+    def __init__(self, ruta, capacidad):
+        self.ruta = ruta
+        self.capacidad = capacidad
+        self.escrituras = 0
+        self._bloqueo = threading.Lock()
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, timeout=1.0, isolation_level=None, check_same_thread=False)
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._conexion.execute('PRAGMA synchronous=NORMAL')
+        self._conexion.execute(
+            'CREATE TABLE IF NOT EXISTS resultados (clave TEXT PRIMARY KEY, valor BLOB, expira REAL, escrito REAL)'
+        )
+
+    def leer(self, clave):
+        with self._bloqueo:
+            fila = self._conexion.execute(
+                'SELECT valor, expira FROM resultados WHERE clave = ?', (clave,)
+            ).fetchone()
+        if fila is None or (fila[1] is not None and fila[1] < time.time()):
+            return None
+        return fila[0]
+
+    def escribir(self, clave, valor, expira):
+        with self._bloqueo:
+            self._conexion.execute(
+                'INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?)', (clave, valor, expira, time.time())
+            )
+            self.escrituras += 1
+            if self.escrituras % PURGA_CADA == 0:
+                self._purgar()
+
+    def _purgar(self):
+        self._conexion.execute('DELETE FROM resultados WHERE expira IS NOT NULL AND expira < ?', (time.time(),))
+        self._conexion.execute(
+            'DELETE FROM resultados WHERE clave IN '
+            '(SELECT clave FROM resultados ORDER BY escrito DESC LIMIT -1 OFFSET ?)', (self.capacidad,)
+        )
+
+    def tamano(self):
+        with self._bloqueo:
+            return self._conexion.execute('SELECT COUNT(*) FROM resultados').fetchone()[0]
+
+
+class CacheResultados:
+    # Caché de resultados de consultas con dos capas: una LRU en memoria acotada por entradas y bytes
+    # y, con `ruta_disco`, un archivo SQLite compartido por los procesos de la máquina. Las entradas
+    # expiran a los `ttl` segundos (sin ttl, nunca) y se guardan serializadas, así que quien recibe un
+    # resultado puede modificarlo sin afectar a la caché. La clave incluye la identidad del estado del
+    # catálogo: tras una actualización las entradas viejas dejan de encontrarse y salen por LRU.
+
+    def __init__(self, capacidad=1024, max_bytes=64 << 20, ttl=None, ruta_disco=None, capacidad_disco=100000):
+        self.capacidad = capacidad
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.metricas = None
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._bloqueo = threading.Lock()
+        self._disco = _CapaDisco(ruta_disco, capacidad_disco) if ruta_disco else None
+
+    def _contar(self, etiqueta):
+        if self.metricas is not None:
+            self.metricas.contar('cache', etiqueta)
+
+    def _clave_disco(self, clave):
+        return hashlib.sha256(repr(clave).encode('utf-8')).hexdigest()
+
+    def obtener(self, clave):
+        # Devuelve (encontrado, valor)
+        ahora = time.monotonic()
+        with self._bloqueo:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                expira, datos = entrada
+                if expira is None or expira > ahora:
+                    self._entradas.move_to_end(clave)
+                else:
+                    self._quitar(clave)
+                    entrada = None
+        if entrada is not None:
+            self._contar('acierto_memoria')
+            return True, pickle.loads(datos)
+
+        if self._disco is not None:
+            try:
+                datos = self._disco.leer(self._clave_disco(clave))
+            except sqlite3.Error:
+                datos = None
+                self._contar('error_disco')
+            if datos is not None:
+                self._contar('acierto_disco')
+                self._guardar_memoria(clave, datos)
+                return True, pickle.loads(datos)
+        self._contar('fallo')
+        return False, None
+
+    def guardar(self, clave, valor):
+        # Un DataFrame que ya en memoria supera el máximo se descarta antes de serializarlo
+        if hasattr(valor, 'memory_usage') and int(valor.memory_usage(index=False).sum()) > TAMANO_MAXIMO_ENTRADA:
+            self._contar('omitida')
+            return
+        datos = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(datos) > TAMANO_MAXIMO_ENTRADA:
+            self._contar('omitida')
+            return
+        self._guardar_memoria(clave, datos)
+        if self._disco is not None:
+            try:
+                self._disco.escribir(self._clave_disco(clave), datos, None if self.ttl is None else time.time() + self.ttl)
+            except sqlite3.Error:
+                self._contar('error_disco')
+
+    def _guardar_memoria(self, clave, datos):
+        expira = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._bloqueo:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (expira, datos)
+            self._bytes += len(datos)
+            while self._entradas and (len(self._entradas) > self.capacidad or self._bytes > self.max_bytes):
+                self._quitar(next(iter(self._entradas)))
+
+    def _quitar(self, clave):
+        _, datos = self._entradas.pop(clave)
+        self._bytes -= len(datos)
+
+    def limpiar(self):
+        with self._bloqueo:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        estadisticas = {'entradas_memoria': len(self._entradas), 'bytes_memoria': self._bytes}
+        if self._disco is not None:
+            try:
+                estadisticas['entradas_disco'] = self._disco.tamano()
+            except sqlite3.Error:
+                pass
+        return estadisticas
+
+
+_firma = functools.lru_cache(maxsize=None)(inspect.signature)
+
+
+def clave_consulta(funcion, recomendador, argumentos, opciones):
+    # Nombre del método, argumentos normalizados (con sus valores por defecto), espacio del recomendador
+    # (CSV y configuración) e identidad del estado del catálogo, que no se repite entre procesos aunque
+    # coincida el número de versión. Si una actualización se publica durante la consulta, el resultado
+    # queda bajo la identidad anterior, que ya nadie vuelve a pedir.
+    enlazados = _firma(funcion).bind(recomendador, *argumentos, **opciones)
+    enlazados.apply_defaults()
+    return (
+        funcion.__name__, recomendador._espacio_cache, recomendador._estado.identidad,
+        tuple(
+            (nombre, _normalizar(valor, _es_texto_buscado(nombre)))
+            for nombre, valor in list(enlazados.arguments.items())[1:]
+        )
+    )
+
+
+def cachear(funcion):
+    # Guarda en self.cache el resultado de un método público de RecomendadorPeliculas
+    @functools.wraps(funcion)
+    def envoltura(self, *argumentos, **opciones):
+        cache = self.cache
+        if cache is None:
+            return funcion(self, *argumentos, **opciones)
+        clave = clave_consulta(funcion, self, argumentos, opciones)
+        encontrado, valor = cache.obtener(clave)
+        if encontrado:
+            return valor
+        valor = funcion(self, *argumentos, **opciones)
+        cache.guardar(clave, valor)
+        return valor
+    return envoltura
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Cada medición corre en un intérprete nuevo para que no influyan los módulos ya importados
+CODIGO_IMPORTACION = """
+import json, sys, time
+inicio = time.perf_counter()
+import movie_recommender
+duracion = time.perf_counter() - inicio
+pesados = sorted(m for m in ('pandas', 'sklearn', 'scipy', 'nltk') if m in sys.modules)
+print(json.dumps({'importacion': duracion, 'modulos_pesados': pesados}))
+"""
+
+CODIGO_PRIMERA_RECOMENDACION = """
+import json, sys, time
+inicio = time.perf_counter()
+from movie_recommender import RecomendadorPeliculas
+recomendador = RecomendadorPeliculas(sys.argv[1], ruta_artefactos=sys.argv[2])
+titulo = recomendador.df['title'].iloc[0]
+pelicula, recomendaciones = recomendador.recomendar_peliculas(titulo)
+print(json.dumps({'primera_recomendacion': time.perf_counter() - inicio, 'encontrada': pelicula is not None}))
+"""
+
+
+def _ejecutar(codigo, *argumentos):
+    resultado = subprocess.run(
+        [sys.executable, '-c', codigo, *argumentos],
+        cwd=DIRECTORIO, capture_output=True, text=True, check=True
+    )
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def _mejor(codigo, clave, repeticiones, *argumentos):
+    # La carga de la máquina solo puede sumar tiempo, así que de varias ejecuciones se toma la más rápida
+    return min((_ejecutar(codigo, *argumentos) for _ in range(max(repeticiones, 1))), key=lambda medida: medida[clave])
+
+
+def medir_arranque(ruta_csv, ruta_artefactos, repeticiones=3):
+    medidas = _mejor(CODIGO_IMPORTACION, 'importacion', repeticiones)
+    # La primera ejecución construye y guarda los artefactos; las siguientes miden arranques en frío que los reutilizan
+    _ejecutar(CODIGO_PRIMERA_RECOMENDACION, ruta_csv, ruta_artefactos)
+    medidas.update(_mejor(CODIGO_PRIMERA_RECOMENDACION, 'primera_recomendacion', repeticiones, ruta_csv, ruta_artefactos))
+    return medidas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Comprueba el presupuesto de tiempo de importación y de primera recomendación')
+    parser.add_argument('--csv', default=os.path.join(DIRECTORIO, 'data', 'movies.csv'))
+    parser.add_argument('--artefactos', default=None)
+    parser.add_argument('--max-importacion', type=float, default=0.5)
+    parser.add_argument('--max-primera-recomendacion', type=float, default=1.0)
+    parser.add_argument('--repeticiones', type=int, default=3, help='arranques en frío medidos; cuenta el más rápido')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporal:
+        ruta_artefactos = args.artefactos or os.path.join(temporal, 'artefactos')
+        medidas = medir_arranque(os.path.abspath(args.csv), ruta_artefactos, args.repeticiones)
+
+    errores = []
+    if medidas['modulos_pesados']:
+        errores.append(f"la importación carga {', '.join(medidas['modulos_pesados'])}")
+    if medidas['importacion'] > args.max_importacion:
+        errores.append(f"importación {medidas['importacion']:.3f}s > {args.max_importacion}s")
+    if medidas['primera_recomendacion'] > args.max_primera_recomendacion:
+        errores.append(f"primera recomendación {medidas['primera_recomendacion']:.3f}s > {args.max_primera_recomendacion}s")
+    if not medidas['encontrada']:
+        errores.append('la primera recomendación no encontró la película')
+
+    medidas['errores'] = errores
+    print(json.dumps(medidas, indent=2))
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import numpy as np
+
+# Bordes fijos del histograma de ratings: 20 intervalos de 0.5 entre 0 y 10
+BORDES_RATING = np.linspace(0.0, 10.0, 21)
+NUM_TOP = 5
+
+
+def _conteos(serie):
+    # (valor, cantidad) de cada valor no nulo, en el orden en que aparece por primera vez. En columnas
+    # categóricas se cuentan los códigos presentes, para que actualizar una fila no recorra todas las categorías
+    if hasattr(serie, 'cat'):
+        codigos = serie.cat.codes.to_numpy()
+        codigos, primeros, cuentas = np.unique(codigos[codigos >= 0], return_index=True, return_counts=True)
+        orden = np.argsort(primeros)
+        return list(zip(serie.cat.categories[codigos[orden]].tolist(), cuentas[orden].tolist()))
+    conteos = serie.value_counts(sort=False, dropna=True)
+    return list(zip(conteos.index.tolist(), conteos.tolist()))
+
+
+def _acumular(contador, pares, signo):
+    for clave, cantidad in pares:
+        valor = contador.get(clave, 0) + signo * cantidad
+        if valor:
+            contador[clave] = valor
+        else:
+            contador.pop(clave, None)
+
+
+def _top(contador, cantidad=NUM_TOP):
+    # Mayores cuentas; a igual cuenta, en el orden en que aparecieron los valores (el de inserción en
+    # el contador, como value_counts sobre el catálogo)
+    return dict(sorted(contador.items(), key=lambda par: -par[1])[:cantidad])
+
+
+class EstadisticasCatalogo:
+    # Estadísticas materializadas del catálogo: sumas y contadores por valor de rating, año, género,
+    # director y país. Se calculan una vez al construir el catálogo y cada actualización aplica solo
+    # las filas agregadas y eliminadas, así que leerlas cuesta O(#valores distintos) y no O(N).
+    # Una instancia no cambia una vez creada: `actualizar` devuelve otra, como el estado del catálogo.
+
+    def __init__(self, df=None):
+        self.total = 0
+        self.suma_rating = 0.0
+        self.ratings = {}
+        self.anios = {}
+        self.generos = {}
+        self.directores = {}
+        self.paises = {}
+        self._resumen = None
+        if df is not None:
+            self._aplicar(df, 1)
+
+    def _aplicar(self, df, signo):
+        self.total += signo * len(df)
+        ratings = df['rating'].to_numpy(dtype=np.float64, na_value=np.nan)
+        ratings = ratings[~np.isnan(ratings)]
+        self.suma_rating += signo * float(ratings.sum())
+        # El rating se guarda en float32; se redondea para que 8.7 cuente como 8.7 y no como 8.699999809
+        valores, cuentas = np.unique(np.round(ratings, 4), return_counts=True)
+        _acumular(self.ratings, zip(valores.tolist(), cuentas.tolist()), signo)
+        _acumular(self.anios, ((int(anio), cantidad) for anio, cantidad in _conteos(df['year'])), signo)
+        _acumular(self.directores, _conteos(df['director']), signo)
+        _acumular(self.paises, _conteos(df['country']), signo)
+        # Cada parte de "Drama/Crimen" cuenta como un género
+        generos = {}
+        for valor, cantidad in _conteos(df['genre']):
+            for parte in str(valor).split('/'):
+                generos[parte] = generos.get(parte, 0) + cantidad
+        _acumular(self.generos, generos.items(), signo)
+
+    def actualizar(self, eliminadas=None, agregadas=None):
+        nuevas = EstadisticasCatalogo()
+        nuevas.total = self.total
+        nuevas.suma_rating = self.suma_rating
+        for nombre in ('ratings', 'anios', 'generos', 'directores', 'paises'):
+            setattr(nuevas, nombre, dict(getattr(self, nombre)))
+        if eliminadas is not None and len(eliminadas):
+            nuevas._aplicar(eliminadas, -1)
+        if agregadas is not None and len(agregadas):
+            nuevas._aplicar(agregadas, 1)
+        return nuevas
+
+    def histograma_ratings(self):
+        valores = np.fromiter(self.ratings.keys(), dtype=np.float64, count=len(self.ratings))
+        cuentas = np.fromiter(self.ratings.values(), dtype=np.int64, count=len(self.ratings))
+        conteos, _ = np.histogram(valores, bins=BORDES_RATING, weights=cuentas)
+        return {'bordes': BORDES_RATING.tolist(), 'conteos': conteos.astype(np.int64).tolist()}
+
+    def resumen(self):
+        # Se arma en la primera lectura de cada versión y se reutiliza en las siguientes
+        if self._resumen is None:
+            con_rating = sum(self.ratings.values())
+            self._resumen = {
+                'total_peliculas': self.total,
+                'rating_promedio': round(self.suma_rating / con_rating, 2) if con_rating else None,
+                'rating_maximo': max(self.ratings) if self.ratings else None,
+                'rating_minimo': min(self.ratings) if self.ratings else None,
+                'rango_anios': f"{min(self.anios)} - {max(self.anios)}" if self.anios else None,
+                'top_generos': _top(self.generos),
+                'top_directores': _top(self.directores),
+                'top_paises': _top(self.paises),
+                'histograma_ratings': self.histograma_ratings(),
+                'peliculas_por_anio': dict(sorted(self.anios.items())),
+            }
+        return self._resumen
@@ -0,0 +1,193 @@
+from functools import reduce
+
+import numpy as np
+
+from indice_titulos import normalizar_titulo
+
+
+def _listas_por_valor(valores):
+    # Agrupa las posiciones de cada valor distinto en una lista ordenada, sin recorrer las filas en Python
+    import pandas as pd
+
+    codigos, unicos = pd.factorize(valores)
+    validos = codigos >= 0
+    posiciones = np.flatnonzero(validos)
+    codigos = codigos[validos]
+    orden = np.argsort(codigos, kind='stable')
+    cortes = np.cumsum(np.bincount(codigos, minlength=len(unicos)))[:-1]
+    return dict(zip(unicos, np.split(posiciones[orden].astype(np.int32), cortes)))
+
+
+def _agrupar_normalizados(listas, separador=None):
+    # Une las listas de valores que normalizan a la misma clave ("Acción" y "accion"); con separador,
+    # cada parte del valor ("Drama/Crimen") cuenta como una clave propia
+    partes_por_clave = {}
+    nombres = {}
+    for valor, posiciones in listas.items():
+        partes = str(valor).split(separador) if separador else [str(valor)]
+        for parte in partes:
+            parte = parte.strip()
+            clave = normalizar_titulo(parte)
+            if not clave:
+                continue
+            partes_por_clave.setdefault(clave, []).append(posiciones)
+            nombres.setdefault(clave, parte)
+    postings = {
+        clave: partes[0] if len(partes) == 1 else np.unique(np.concatenate(partes))
+        for clave, partes in partes_por_clave.items()
+    }
+    return postings, nombres
+
+
+class _FacetaRango:
+    # Valores ordenados para responder rangos con búsqueda binaria
+
+    def __init__(self, valores):
+        self.valores = valores
+        self.orden = np.argsort(valores, kind='stable').astype(np.int32)
+        self.ordenados = valores[self.orden]
+
+    def limites(self):
+        validos = self.ordenados[~np.isnan(self.ordenados)]
+        if validos.size == 0:
+            return None, None
+        return validos[0].item(), validos[-1].item()
+
+    def _convertir(self, valor):
+        # El límite se lleva al tipo de la columna: 8.7 en float64 es mayor que 8.7 guardado en float32
+        return None if valor is None else self.valores.dtype.type(valor)
+
+    def intervalo(self, minimo, maximo):
+        minimo, maximo = self._convertir(minimo), self._convertir(maximo)
+        inicio = 0 if minimo is None else int(np.searchsorted(self.ordenados, minimo, side='left'))
+        # Los NaN quedan al final del orden y nunca entran en un rango
+        tope = self._convertir(np.inf) if maximo is None else maximo
+        fin = int(np.searchsorted(self.ordenados, tope, side='right'))
+        return inicio, max(fin, inicio)
+
+    def tamano(self, minimo, maximo):
+        inicio, fin = self.intervalo(minimo, maximo)
+        return fin - inicio
+
+    def posiciones(self, minimo, maximo):
+        inicio, fin = self.intervalo(minimo, maximo)
+        return np.sort(self.orden[inicio:fin])
+
+    def filtrar(self, candidatos, minimo, maximo):
+        minimo, maximo = self._convertir(minimo), self._convertir(maximo)
+        valores = self.valores[candidatos]
+        mascara = ~np.isnan(valores)
+        if minimo is not None:
+            mascara &= valores >= minimo
+        if maximo is not None:
+            mascara &= valores <= maximo
+        return candidatos[mascara]
+
+
+class IndiceFacetas:
+    # Listas de posiciones por género (separando "Drama/Crimen"), director y país, y valores
+    # ordenados de año y rating. Se construye una vez por versión del catálogo.
+
+    def __init__(self, df):
+        self.df = df
+        self.total = len(df)
+        self.generos, self.nombres_generos = _agrupar_normalizados(_listas_por_valor(df['genre']), separador='/')
+        self.directores, self.nombres_directores = _agrupar_normalizados(_listas_por_valor(df['director']))
+        self.paises, self.nombres_paises = _agrupar_normalizados(_listas_por_valor(df['country']))
+        self.anios = _FacetaRango(df['year'].to_numpy(dtype='float64', na_value=np.nan))
+        self.ratings = _FacetaRango(df['rating'].to_numpy(dtype='float32', na_value=np.nan))
+        # Posición de cada fila en el orden por rating descendente (los NaN al final)
+        self.rango_rating = self._calcular_rango(-self.ratings.valores)
+        # Rangos de los demás órdenes, calculados la primera vez que se piden
+        self._rangos = {('rating', True): self.rango_rating}
+
+    def _calcular_rango(self, claves):
+        rango = np.empty(self.total, dtype=np.int32)
+        rango[np.argsort(claves, kind='stable')] = np.arange(self.total, dtype=np.int32)
+        return rango
+
+    def rango(self, columna, descendente):
+        # Posición de cada fila al ordenar por `columna`; los valores ausentes quedan al final en ambos sentidos
+        clave = (columna, descendente)
+        if clave not in self._rangos:
+            if columna == 'rating':
+                valores = self.ratings.valores.astype(np.float64)
+            elif columna == 'year':
+                valores = self.anios.valores
+            elif columna == 'title':
+                # Los títulos se ordenan por su forma normalizada (sin acentos ni mayúsculas)
+                titulos = np.array([normalizar_titulo(titulo) for titulo in self.df['title'].tolist()], dtype=object)
+                valores = self._calcular_rango(titulos).astype(np.float64)
+            else:
+                raise ValueError(f"No se puede ordenar por '{columna}'")
+            self._rangos[clave] = self._calcular_rango(-valores if descendente else valores)
+        return self._rangos[clave]
+
+    def pagina(self, candidatos, ordenar_por=None, descendente=False, inicio=0, fin=None):
+        # Devuelve solo las posiciones [inicio, fin) del orden pedido: se seleccionan los `fin` primeros
+        # con argpartition y únicamente esos se ordenan
+        fin = len(candidatos) if fin is None else min(fin, len(candidatos))
+        if inicio >= fin:
+            return candidatos[:0]
+        if ordenar_por is None:
+            return candidatos[inicio:fin]
+        claves = self.rango(ordenar_por, descendente)[candidatos]
+        if fin < len(candidatos):
+            primeros = np.argpartition(claves, fin - 1)[:fin]
+        else:
+            primeros = np.arange(len(candidatos))
+        primeros = primeros[np.argsort(claves[primeros], kind='stable')]
+        return candidatos[primeros[inicio:fin]]
+
+    @staticmethod
+    def _buscar(postings, valor):
+        clave = normalizar_titulo(valor)
+        if clave in postings:
+            return postings[clave]
+        # Sin coincidencia exacta se aceptan claves que contengan el texto, como hacía str.contains
+        parciales = [lista for otra, lista in postings.items() if clave and clave in otra]
+        if not parciales:
+            return np.empty(0, dtype=np.int32)
+        return parciales[0] if len(parciales) == 1 else np.unique(np.concatenate(parciales))
+
+    def filtrar(self, genero=None, director=None, anios=None, rating=None, pais=None, ordenar_por=None):
+        conjuntos = []
+        if genero is not None:
+            conjuntos.append(self._buscar(self.generos, genero))
+        if director is not None:
+            conjuntos.append(self._buscar(self.directores, director))
+        if pais is not None:
+            conjuntos.append(self._buscar(self.paises, pais))
+
+        rangos = [
+            (faceta, limites[0], limites[1])
+            for faceta, limites in ((self.anios, anios), (self.ratings, rating))
+            if limites is not None
+        ]
+
+        if conjuntos:
+            conjuntos.sort(key=len)
+            candidatos = reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), conjuntos)
+        elif rangos:
+            # El rango más selectivo da los candidatos; los demás se comprueban sobre ellos
+            rangos.sort(key=lambda rango: rango[0].tamano(rango[1], rango[2]))
+            faceta, minimo, maximo = rangos.pop(0)
+            candidatos = faceta.posiciones(minimo, maximo)
+        else:
+            candidatos = np.arange(self.total, dtype=np.int32)
+
+        for faceta, minimo, maximo in rangos:
+            candidatos = faceta.filtrar(candidatos, minimo, maximo)
+
+        if ordenar_por == 'rating':
+            candidatos = candidatos[np.argsort(self.rango_rating[candidatos], kind='stable')]
+        return candidatos
+
+    def listar_generos(self):
+        return sorted(self.nombres_generos.values())
+
+    def listar_directores(self):
+        return sorted(self.nombres_directores.values())
+
+    def listar_paises(self):
+        return sorted(self.nombres_paises.values())
@@ -0,0 +1,145 @@
+import numpy as np
+
+from motores import MotorIVF
+
+# Términos que describen cada grupo
+NUM_TERMINOS = 10
+# Palabras vacías del español que no se muestran como términos de un grupo: el vectorizador solo quita
+# las del inglés y las descripciones del catálogo están en español
+PALABRAS_VACIAS = frozenset('''
+a al algo algunos ante antes aquel aquella como con contra cual cuando de del desde donde durante e el
+ella ellas ellos en entre era es esa ese eso esta este esto estos fue ha han hasta hay la las le les lo
+los mas me mi mientras muy ni no nos o otra otro para pero por que quien se ser si sin sobre son su sus
+tan te tiene todo tras tu un una uno unos y ya
+'''.split())
+
+
+def _puntuaciones_grupos(filas, centroides):
+    # Con filas normalizadas, el centroide más cercano en distancia euclídea es el de mayor x·c - |c|²/2,
+    # el mismo criterio con el que k-means asigna las filas
+    normas = np.einsum('ij,ij->i', centroides, centroides)
+    puntuaciones = filas @ centroides.T
+    return np.asarray(puntuaciones, dtype=np.float64) - normas / 2
+
+
+def _asignar_grupos(filas, centroides, tamano_bloque=4096):
+    asignacion = np.empty(filas.shape[0], dtype=np.int32)
+    for inicio in range(0, filas.shape[0], tamano_bloque):
+        puntuaciones = _puntuaciones_grupos(filas[inicio:inicio + tamano_bloque], centroides)
+        asignacion[inicio:inicio + tamano_bloque] = np.argmax(puntuaciones, axis=1)
+    return asignacion
+
+
+class AgrupamientoCatalogo:
+    # Agrupamiento del catálogo completo con k-means por mini-lotes sobre los vectores TF-IDF. Los
+    # centroides están en el espacio de términos, así que los términos de mayor peso de cada uno
+    # describen el grupo. En estado.modelos['grupos'] queda (centroides, asignacion, orden, inicios,
+    # terminos), con `orden` e `inicios` como en el índice IVF: el grupo g ocupa orden[inicios[g]:inicios[g + 1]].
+    nombre = 'grupos'
+    TAMANO_LOTE = 2048
+    INICIALIZACIONES = 3
+
+    def __init__(self, num_grupos=None, semilla=0):
+        self.num_grupos = num_grupos
+        self.semilla = semilla
+
+    def _num_grupos(self, total):
+        # Por defecto ~√(N/2) grupos: unos 8 en el catálogo de ejemplo y ~700 con un millón de películas
+        grupos = self.num_grupos if self.num_grupos is not None else int(np.sqrt(total / 2))
+        return int(min(max(grupos, 1), max(total, 1)))
+
+    @staticmethod
+    def _terminos(centroides, vocabulario, media=None):
+        # Los NUM_TERMINOS términos que más sobresalen en cada centroide respecto de `media` (el centroide de
+        # todo el catálogo), de mayor a menor y sin palabras vacías: lo que todo el catálogo comparte no
+        # distingue a un grupo de los demás
+        destacados = np.array(centroides if media is None else centroides - media, dtype=np.float32)
+        vacias = [indice for indice, termino in enumerate(vocabulario) if termino in PALABRAS_VACIAS]
+        destacados[:, vacias] = 0
+        cantidad = min(NUM_TERMINOS, centroides.shape[1])
+        terminos = []
+        for centroide in destacados:
+            mejores = np.argpartition(-centroide, cantidad - 1)[:cantidad] if cantidad else np.empty(0, dtype=np.int64)
+            mejores = mejores[np.argsort(-centroide[mejores], kind='stable')]
+            terminos.append([vocabulario[termino] for termino in mejores if centroide[termino] > 0])
+        return terminos
+
+    def ajustar(self, matriz_tfidf, vocabulario):
+        from sklearn.cluster import MiniBatchKMeans
+
+        total = matriz_tfidf.shape[0]
+        grupos = self._num_grupos(total)
+        if total == 0 or matriz_tfidf.shape[1] == 0 or grupos == 1:
+            centroides = np.zeros((min(grupos, total), matriz_tfidf.shape[1]), dtype=np.float32)
+            if total:
+                centroides[0] = np.asarray(matriz_tfidf.mean(axis=0)).ravel()
+            indice = MotorIVF.indice_desde_asignacion(centroides, np.zeros(total, dtype=np.int32))
+            return indice + (self._terminos(centroides, vocabulario),)
+        kmeans = MiniBatchKMeans(
+            n_clusters=grupos, batch_size=self.TAMANO_LOTE, n_init=self.INICIALIZACIONES,
+            random_state=self.semilla
+        )
+        # sklearn deja en labels_ el grupo de cada fila con los centroides finales. Se ajusta sobre una
+        # copia: la matriz cargada de artefactos es un mmap de solo lectura y sklearn no la acepta
+        kmeans.fit(matriz_tfidf.copy())
+        centroides = np.ascontiguousarray(kmeans.cluster_centers_, dtype=np.float32)
+        asignacion = kmeans.labels_.astype(np.int32)
+        media = np.asarray(matriz_tfidf.mean(axis=0)).ravel()
+        return MotorIVF.indice_desde_asignacion(centroides, asignacion) + (self._terminos(centroides, vocabulario, media),)
+
+    def modelo(self, estado):
+        grupos = estado.modelos.get(self.nombre)
+        if grupos is None:
+            vocabulario = estado.vectorizador.vocabulary_
+            grupos = estado.modelos[self.nombre] = self.ajustar(
+                estado.matriz_tfidf, sorted(vocabulario, key=vocabulario.get)
+            )
+        return grupos
+
+    def actualizar(self, anterior, nuevo, cambiadas, mapa):
+        # Como en el IVF: las filas conservadas mantienen su grupo y las nuevas o modificadas van al
+        # centroide más cercano. Centroides y términos no cambian hasta reconstruir.
+        grupos = anterior.modelos.get(self.nombre)
+        if grupos is None:
+            return
+        centroides, asignacion, terminos = grupos[0], grupos[1], grupos[4]
+        total = nuevo.matriz_tfidf.shape[0]
+        nueva = np.zeros(total, dtype=np.int32)
+        if mapa is not None:
+            conservadas = np.flatnonzero(mapa >= 0)
+            nueva[mapa[conservadas]] = asignacion[conservadas]
+        else:
+            nueva[:len(asignacion)] = asignacion
+        if len(cambiadas):
+            nueva[cambiadas] = _asignar_grupos(nuevo.matriz_tfidf[cambiadas], centroides)
+        nuevo.modelos[self.nombre] = MotorIVF.indice_desde_asignacion(centroides, nueva) + (terminos,)
+
+    @staticmethod
+    def cercanos(grupos, matriz_tfidf, indice, cantidad):
+        # El grupo de la fila `indice` y los siguientes más cercanos a su vector, sin grupos vacíos
+        centroides, asignacion, _, inicios, _ = grupos
+        puntuaciones = _puntuaciones_grupos(matriz_tfidf[indice], centroides)[0]
+        puntuaciones[np.diff(inicios) == 0] = -np.inf
+        puntuaciones[asignacion[indice]] = np.inf
+        orden = np.argsort(-puntuaciones, kind='stable')[:cantidad]
+        return orden[puntuaciones[orden] > -np.inf]
+
+    @staticmethod
+    def similares(grupos, grupo, cantidad):
+        # Grupos no vacíos cuyos centroides forman menor ángulo con el de `grupo`, sin él;
+        # devuelve (grupos, cosenos)
+        centroides, _, _, inicios, _ = grupos
+        normas = np.linalg.norm(centroides, axis=1)
+        normas[normas == 0] = 1
+        cosenos = (centroides @ centroides[grupo]) / (normas * normas[grupo])
+        cosenos[np.diff(inicios) == 0] = -np.inf
+        cosenos[grupo] = -np.inf
+        orden = np.argsort(-cosenos, kind='stable')[:cantidad]
+        orden = orden[cosenos[orden] > -np.inf]
+        return orden, cosenos[orden]
+
+    @staticmethod
+    def miembros(grupos, seleccion):
+        _, _, orden, inicios, _ = grupos
+        partes = [orden[inicios[grupo]:inicios[grupo + 1]] for grupo in seleccion]
+        return np.concatenate(partes) if partes else orden[:0]
@@ -0,0 +1,392 @@
+import heapq
+import os
+import re
+import unicodedata
+from bisect import insort
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+import numpy as np
+
+_NO_ALFANUMERICO = re.compile(r'[\W_]+')
+# Máximo de posiciones que se cuentan de una vez en las etapas por palabra y aproximada: con listas de
+# trigramas muy largas (catálogos grandes, vocabulario repetido) el resto solo se consulta para esos candidatos
+PRESUPUESTO_CANDIDATOS = 32768
+# Con tan pocos candidatos sale más barato verificarlos que seguir intersectando listas
+CANDIDATOS_VERIFICABLES = 64
+# Títulos que se llegan a verificar, como mucho, en la etapa por palabra
+VERIFICACIONES_MAXIMAS = 512
+
+
+def normalizar_titulo(titulo):
+    # Minúsculas, sin acentos y sin puntuación: "Amélie!" -> "amelie". Solo se quitan las marcas
+    # combinables, así que las letras de otras escrituras ("Брат", "千と千尋の神隠し") se conservan
+    if not isinstance(titulo, str):
+        return ''
+    sin_acentos = unicodedata.normalize('NFKD', titulo)
+    if not sin_acentos.isascii():
+        sin_acentos = ''.join(caracter for caracter in sin_acentos if not unicodedata.combining(caracter))
+    return _NO_ALFANUMERICO.sub(' ', sin_acentos.lower()).strip()
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceTitulos:
+    # Índice invertido de trigramas sobre los títulos normalizados, construido una sola vez.
+    # La búsqueda recorre las mismas etapas que antes (exacta, parcial, por palabra) y añade
+    # una etapa aproximada para errores tipográficos ("Matirx" -> "Matrix").
+
+    def __init__(self, titulos, umbral_aproximado=0.75, max_candidatos=32, postings=None, orden=None,
+                 longitudes=None):
+        self.umbral_aproximado = umbral_aproximado
+        self.max_candidatos = max_candidatos
+        self.titulos = [normalizar_titulo(titulo) for titulo in titulos] if postings is None else list(titulos)
+        if longitudes is None:
+            longitudes = np.array([len(titulo) for titulo in self.titulos], dtype=np.int32)
+        self.longitudes = longitudes
+        # `orden` (guardado con los artefactos) tiene la primera posición de cada título distinto, ordenadas
+        # por título: la búsqueda exacta lo recorre por bisección sin armar el diccionario al arrancar
+        self._orden = orden
+        self._exactos = None
+        if postings is None:
+            listas = defaultdict(list)
+            for indice, titulo in enumerate(self.titulos):
+                for trigrama in _trigramas(f' {titulo} '):
+                    listas[trigrama].append(indice)
+            postings = {trigrama: np.array(indices, dtype=np.int32) for trigrama, indices in listas.items()}
+        self.postings = postings
+
+    @property
+    def exactos(self):
+        # Título normalizado -> primera posición en que aparece; se arma la primera vez que se pide
+        if self._exactos is None:
+            # Al recorrer en orden inverso, el primer índice de cada título repetido es el que queda
+            self._exactos = dict(zip(reversed(self.titulos), range(len(self.titulos) - 1, -1, -1)))
+        return self._exactos
+
+    def _exacto(self, consulta):
+        if self._exactos is not None or self._orden is None:
+            return self.exactos.get(consulta)
+        inicio, fin = 0, len(self._orden)
+        while inicio < fin:
+            medio = (inicio + fin) // 2
+            if self.titulos[self._orden[medio]] < consulta:
+                inicio = medio + 1
+            else:
+                fin = medio
+        if inicio < len(self._orden) and self.titulos[self._orden[inicio]] == consulta:
+            return int(self._orden[inicio])
+        return None
+
+    def actualizar(self, mapa=None, titulos=None):
+        # Devuelve un índice nuevo sin modificar el actual, que puede seguir atendiendo búsquedas.
+        # `mapa` traduce posiciones antiguas a nuevas (-1 si la fila se eliminó) y `titulos`
+        # asigna títulos a posiciones nuevas: las que ya existen cambian de título y las demás se añaden al final.
+        normalizados = self.titulos
+        postings = dict(self.postings)
+        if mapa is not None:
+            mapa = np.asarray(mapa)
+            normalizados = [titulo for titulo, posicion in zip(normalizados, mapa.tolist()) if posicion >= 0]
+            for trigrama, lista in self.postings.items():
+                lista = mapa[lista]
+                lista = lista[lista >= 0].astype(np.int32)
+                if lista.size:
+                    postings[trigrama] = lista
+                else:
+                    del postings[trigrama]
+        else:
+            normalizados = list(normalizados)
+
+        quitar = defaultdict(list)
+        agregar = defaultdict(list)
+        for posicion, titulo in sorted((titulos or {}).items()):
+            titulo = normalizar_titulo(titulo)
+            if posicion < len(normalizados):
+                for trigrama in _trigramas(f' {normalizados[posicion]} '):
+                    quitar[trigrama].append(posicion)
+                normalizados[posicion] = titulo
+            else:
+                normalizados.append(titulo)
+            for trigrama in _trigramas(f' {titulo} '):
+                agregar[trigrama].append(posicion)
+
+        for trigrama, posiciones in quitar.items():
+            lista = postings[trigrama]
+            postings[trigrama] = lista[~np.isin(lista, posiciones)]
+        # Las listas se mantienen ordenadas: las búsquedas las intersectan con búsqueda binaria
+        for trigrama, posiciones in agregar.items():
+            lista = postings.get(trigrama, np.empty(0, dtype=np.int32))
+            postings[trigrama] = np.sort(np.concatenate((lista, np.array(posiciones, dtype=np.int32))))
+
+        return IndiceTitulos(
+            normalizados, umbral_aproximado=self.umbral_aproximado,
+            max_candidatos=self.max_candidatos, postings=postings
+        )
+
+    def guardar(self, directorio):
+        # Las listas de trigramas se guardan concatenadas en un único arreglo con sus desplazamientos
+        trigramas = list(self.postings)
+        longitudes = np.array([len(self.postings[trigrama]) for trigrama in trigramas], dtype=np.int64)
+        desplazamientos = np.concatenate(([0], np.cumsum(longitudes)))
+        planos = np.concatenate([self.postings[trigrama] for trigrama in trigramas]) if trigramas else np.empty(0, dtype=np.int32)
+        with open(os.path.join(directorio, 'titulos_normalizados.txt'), 'w', encoding='utf-8') as archivo:
+            archivo.write('\n'.join(self.titulos))
+        with open(os.path.join(directorio, 'trigramas.txt'), 'w', encoding='utf-8') as archivo:
+            archivo.write('\n'.join(trigramas))
+        orden = self._orden
+        if orden is None:
+            orden = sorted(self.exactos.values(), key=self.titulos.__getitem__)
+        np.save(os.path.join(directorio, 'titulos_orden.npy'), np.asarray(orden, dtype=np.int32))
+        np.save(os.path.join(directorio, 'titulos_longitudes.npy'), self.longitudes.astype(np.int32, copy=False))
+        np.save(os.path.join(directorio, 'trigramas_desplazamientos.npy'), desplazamientos)
+        np.save(os.path.join(directorio, 'trigramas_postings.npy'), planos.astype(np.int32, copy=False))
+
+    @classmethod
+    def cargar(cls, directorio, num_titulos, **kwargs):
+        with open(os.path.join(directorio, 'titulos_normalizados.txt'), encoding='utf-8') as archivo:
+            titulos = archivo.read().split('\n') if num_titulos else []
+        with open(os.path.join(directorio, 'trigramas.txt'), encoding='utf-8') as archivo:
+            contenido = archivo.read()
+        trigramas = contenido.split('\n') if contenido else []
+        desplazamientos = np.load(os.path.join(directorio, 'trigramas_desplazamientos.npy'))
+        planos = np.load(os.path.join(directorio, 'trigramas_postings.npy'), mmap_mode='r')
+        postings = {
+            trigrama: planos[inicio:fin]
+            for trigrama, inicio, fin in zip(trigramas, desplazamientos[:-1].tolist(), desplazamientos[1:].tolist())
+        }
+        return cls(
+            titulos, postings=postings, orden=np.load(os.path.join(directorio, 'titulos_orden.npy'), mmap_mode='r'),
+            longitudes=np.load(os.path.join(directorio, 'titulos_longitudes.npy'), mmap_mode='r'), **kwargs
+        )
+
+    def __len__(self):
+        return len(self.titulos)
+
+    def buscar(self, consulta, limite=5):
+        # Devuelve una lista ordenada de (indice, puntuacion, tipo_coincidencia)
+        consulta = normalizar_titulo(consulta)
+        if not consulta:
+            return []
+
+        indice = self._exacto(consulta)
+        if indice is not None:
+            return [(indice, 1.0, 'exacta')]
+
+        parciales = self._buscar_subcadena(consulta, limite)
+        if parciales:
+            return [(indice, len(consulta) / max(int(self.longitudes[indice]), 1), 'parcial') for indice in parciales]
+
+        por_palabra = self._buscar_palabras(consulta, limite)
+        if por_palabra:
+            return por_palabra
+
+        return self._buscar_aproximado(consulta, limite)
+
+    def _posting(self, trigrama):
+        return self.postings.get(trigrama, np.empty(0, dtype=np.int32))
+
+    @staticmethod
+    def _contenidos(lista, candidatos):
+        # Máscara de los candidatos que están en `lista` (ordenada): una búsqueda binaria por candidato,
+        # O(c·log n) en lugar de recorrer la lista completa como intersect1d. Con muchos candidatos frente
+        # al tamaño de la lista sale más barata una tabla de pertenencia
+        if lista.size == 0:
+            return np.zeros(len(candidatos), dtype=bool)
+        if len(candidatos) > 4096 and len(candidatos) * 8 > lista.size:
+            return np.isin(candidatos, lista, kind='table')
+        posiciones = np.searchsorted(lista, candidatos)
+        posiciones[posiciones == lista.size] = 0
+        return lista[posiciones] == candidatos
+
+    def _listas(self, texto):
+        return sorted((self._posting(trigrama) for trigrama in _trigramas(texto)), key=len)
+
+    def _candidatos_subcadena(self, texto):
+        # Títulos que contienen todos los trigramas de `texto`. Primero se intersectan la lista más corta de
+        # cada palabra y las de los trigramas que cruzan un espacio: las de palabras distintas son casi
+        # independientes y la intersección se reduce enseguida, mientras que los trigramas de una misma
+        # palabra suelen aparecer juntos. Puede sobrar algún candidato (se para al quedar pocos) porque
+        # _buscar_subcadena los verifica
+        if len(texto) < 3:
+            return self._posting(f' {texto}'[:3])
+        trigramas = _trigramas(texto)
+        primeras = [self._listas(palabra)[0] for palabra in texto.split() if len(palabra) >= 3]
+        primeras += [self._posting(trigrama) for trigrama in trigramas if ' ' in trigrama]
+        listas = sorted(primeras, key=len)
+        listas += sorted((self._posting(trigrama) for trigrama in trigramas if ' ' not in trigrama), key=len)
+        candidatos = listas[0]
+        for lista in listas[1:]:
+            if candidatos.size <= CANDIDATOS_VERIFICABLES:
+                break
+            candidatos = candidatos[self._contenidos(lista, candidatos)]
+        return candidatos
+
+    def _por_longitud(self, candidatos, bloque=64):
+        # (índice, longitud) de los candidatos (ordenados) del título más corto al más largo y, a igual
+        # longitud, por posición. Solo se ordena lo que se llega a recorrer: cada bloque abarca hasta la
+        # longitud del k-ésimo candidato más corto y k se duplica en cada bloque
+        longitudes = self.longitudes[candidatos]
+        while candidatos.size:
+            if candidatos.size > bloque:
+                dentro = longitudes <= np.partition(longitudes, bloque - 1)[bloque - 1]
+            else:
+                dentro = np.ones(candidatos.size, dtype=bool)
+            seleccion, longitudes_seleccion = candidatos[dentro], longitudes[dentro]
+            orden = np.argsort(longitudes_seleccion, kind='stable')
+            yield from zip(seleccion[orden].tolist(), longitudes_seleccion[orden].tolist())
+            candidatos, longitudes = candidatos[~dentro], longitudes[~dentro]
+            bloque *= 2
+
+    def _por_cota(self, indices, cotas):
+        # (cota, índice, longitud) de mayor a menor cota y, a igual cota, como _por_longitud. Cada nivel se
+        # ordena solo cuando se llega a él
+        for cota in range(int(cotas.max()), 0, -1):
+            for indice, longitud in self._por_longitud(indices[cotas == cota]):
+                yield cota, indice, longitud
+
+    def _buscar_subcadena(self, consulta, limite):
+        # Los títulos más cortos cubren mejor la consulta; se verifican en ese orden hasta llenar el límite
+        encontrados = []
+        for indice, _ in self._por_longitud(self._candidatos_subcadena(consulta)):
+            if consulta in self.titulos[indice]:
+                encontrados.append(indice)
+                if len(encontrados) == limite:
+                    break
+        return encontrados
+
+    def _buscar_palabras(self, consulta, limite):
+        palabras = [palabra for palabra in consulta.split() if len(palabra) >= 3]
+        if len(palabras) < 2:
+            return []
+        # Candidatos: los títulos con el trigrama menos frecuente de alguna palabra, un superconjunto de los
+        # que la contienen. Se evitan los trigramas que también tienen otras palabras de la consulta ("tor"
+        # en "actor" e "instructor"), que darían a un título aciertos de palabras que no contiene. Las palabras
+        # cuya lista no cabe en el presupuesto ("los", "the") no aportan candidatos, solo aciertos
+        raras = []
+        for palabra in palabras:
+            otras = set().union(*(_trigramas(otra) for otra in palabras if otra != palabra))
+            propios = _trigramas(palabra) - otras
+            lista = min((self._posting(trigrama) for trigrama in propios or _trigramas(palabra)), key=len)
+            if lista.size:
+                raras.append(lista)
+        raras.sort(key=len)
+        generadoras = []
+        comunes = []
+        total = 0
+        for lista in raras:
+            if generadoras and total + lista.size > PRESUPUESTO_CANDIDATOS:
+                comunes.append(lista)
+                continue
+            generadoras.append(lista)
+            total += lista.size
+        if not generadoras:
+            return []
+
+        # Cota de aciertos de cada candidato: las listas en que aparece, buscando en las de palabras comunes
+        # con búsqueda binaria. Se verifican por cota, longitud y posición y se para en cuanto la siguiente
+        # cota ya no puede entrar entre los `limite` mejores (el mismo resultado que verificándolos todos)
+        # o tras VERIFICACIONES_MAXIMAS títulos
+        indices, cotas = np.unique(np.concatenate(generadoras), return_counts=True)
+        for lista in comunes:
+            cotas += self._contenidos(lista, indices)
+        mejores = []
+        for numero, (cota, indice, longitud) in enumerate(self._por_cota(indices, cotas)):
+            if numero == VERIFICACIONES_MAXIMAS or (len(mejores) == limite and (-cota, longitud, indice) >= mejores[-1][0]):
+                break
+            titulo = self.titulos[indice]
+            aciertos = sum([palabra in titulo for palabra in palabras])
+            if aciertos:
+                insort(mejores, ((-aciertos, longitud, indice), aciertos))
+                del mejores[limite:]
+        return [(clave[2], aciertos / len(palabras), 'palabra') for clave, aciertos in mejores]
+
+    def _mas_compartidos(self, listas, cantidad):
+        # Los `cantidad` títulos que aparecen en más listas (a igualdad, por posición), sin juntar todas: se
+        # cuentan las g más cortas que quepan en el presupuesto y en las demás solo se buscan esos candidatos.
+        # Un título ausente de las g primeras aparece a lo sumo en len(listas) - g, así que el resultado es
+        # el mismo que contándolas todas si el corte final supera esa cifra; si no, se cuenta una lista más.
+        # Por eso, antes de cada búsqueda se descartan los candidatos que ya no pueden llegar a ella ni al
+        # `cantidad`-ésimo actual
+        g = 1
+        while g < len(listas) and sum(lista.size for lista in listas[:g + 1]) <= PRESUPUESTO_CANDIDATOS:
+            g += 1
+        while True:
+            indices, aciertos = np.unique(np.concatenate(listas[:g]), return_counts=True)
+            for numero in range(g, len(listas)):
+                objetivo = max(len(listas) - g + 1, _corte(aciertos, cantidad))
+                vivos = aciertos >= objetivo - (len(listas) - numero)
+                indices, aciertos = indices[vivos], aciertos[vivos]
+                aciertos += self._contenidos(listas[numero], indices)
+            orden = np.argsort(-aciertos, kind='stable')[:cantidad]
+            if g == len(listas) or (orden.size == cantidad and aciertos[orden[-1]] > len(listas) - g):
+                return indices[orden].tolist()
+            g += 1
+
+    def _buscar_aproximado(self, consulta, limite):
+        # Candidatos: los títulos que comparten más trigramas con las (hasta 8) listas más cortas
+        listas = sorted((self._posting(trigrama) for trigrama in _trigramas(f' {consulta} ')), key=len)
+        listas = [lista for lista in listas if lista.size][:8]
+        if not listas:
+            return []
+        mejores = self._mas_compartidos(listas, self.max_candidatos)
+
+        # La consulta se compara con cada título y con cada ventana de tantas palabras como tenga. quick_ratio
+        # (caracteres en común) acota la similitud y se calcula para todos a la vez; la similitud exacta se
+        # calcula de mayor a menor cota y se para cuando la cota ya no alcanza el umbral ni a los `limite` mejores
+        num_palabras = len(consulta.split())
+        textos = []
+        duenos = []
+        for indice in mejores:
+            ventanas = _ventanas(self.titulos[indice], num_palabras)
+            textos.extend(ventanas)
+            duenos.extend([indice] * len(ventanas))
+        cotas = _cotas_caracteres(consulta, textos)
+        comparador = SequenceMatcher(None, b=consulta)
+        puntuaciones = {}
+        for posicion in np.argsort(-cotas, kind='stable').tolist():
+            cota = cotas[posicion]
+            if cota <= self.umbral_aproximado - 1e-9:
+                break
+            if len(puntuaciones) >= limite and cota < heapq.nlargest(limite, puntuaciones.values())[-1]:
+                break
+            indice = duenos[posicion]
+            if puntuaciones.get(indice, 0.0) >= cota:
+                continue
+            comparador.set_seq1(textos[posicion])
+            puntuacion = comparador.ratio()
+            if puntuacion >= self.umbral_aproximado and puntuacion > puntuaciones.get(indice, 0.0):
+                puntuaciones[indice] = puntuacion
+        resultados = sorted(puntuaciones.items(), key=lambda par: (-par[1], self.longitudes[par[0]], par[0]))
+        return [(indice, puntuacion, 'aproximada') for indice, puntuacion in resultados[:limite]]
+
+
+def _corte(aciertos, cantidad):
+    # El `cantidad`-ésimo mayor de `aciertos` (enteros pequeños), o 0 si hay menos; con un histograma en lugar
+    # de np.partition, que con tantos valores repetidos es mucho más lento
+    if aciertos.size < cantidad:
+        return 0
+    acumulado = np.cumsum(np.bincount(aciertos)[::-1])
+    return len(acumulado) - 1 - int(np.searchsorted(acumulado, cantidad))
+
+
+def _ventanas(titulo, num_palabras):
+    # El título completo y cada tramo de `num_palabras` palabras consecutivas
+    palabras = titulo.split()
+    return [titulo] + [' '.join(palabras[inicio:inicio + num_palabras]) for inicio in range(len(palabras) - num_palabras + 1)]
+
+
+def _cotas_caracteres(consulta, textos):
+    # quick_ratio de difflib para muchos textos a la vez: 2·(caracteres en común, con repetición) / (suma de
+    # longitudes). Solo cuentan los caracteres de la consulta, así que los histogramas tienen una posición
+    # por cada uno de ellos y una última para el resto
+    longitudes = np.array([len(texto) for texto in textos], dtype=np.int64)
+    alfabeto, propio = np.unique(np.frombuffer(consulta.encode('utf-32-le'), dtype=np.uint32), return_counts=True)
+    codigos = np.frombuffer(''.join(textos).encode('utf-32-le'), dtype=np.uint32)
+    columnas = np.minimum(np.searchsorted(alfabeto, codigos), len(alfabeto) - 1)
+    columnas[alfabeto[columnas] != codigos] = len(alfabeto)
+    ancho = len(alfabeto) + 1
+    filas = np.repeat(np.arange(len(textos)), longitudes)
+    histogramas = np.bincount(filas * ancho + columnas, minlength=len(textos) * ancho).reshape(len(textos), ancho)
+    return 2.0 * np.minimum(histogramas[:, :-1], propio).sum(axis=1) / (longitudes + len(consulta))
@@ -0,0 +1,142 @@
+import functools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+PREFIJO_PROMETHEUS = 'recomendador'
+
+
+class _Temporizador:
+    # Totales exactos más una ventana de las últimas duraciones para los percentiles
+
+    def __init__(self, tamano_ventana):
+        self.cuenta = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self.ventana = deque(maxlen=tamano_ventana)
+
+    def registrar(self, segundos):
+        self.cuenta += 1
+        self.suma += segundos
+        self.maximo = max(self.maximo, segundos)
+        self.ventana.append(segundos)
+
+    def resumen(self):
+        p50, p99 = np.percentile(np.fromiter(self.ventana, dtype=np.float64), [50, 99]) if self.ventana else (0.0, 0.0)
+        return {
+            'cuenta': self.cuenta,
+            'suma_s': round(self.suma, 6),
+            'media_ms': round(self.suma / self.cuenta * 1000, 4) if self.cuenta else 0.0,
+            'p50_ms': round(float(p50) * 1000, 4),
+            'p99_ms': round(float(p99) * 1000, 4),
+            'max_ms': round(self.maximo * 1000, 4),
+        }
+
+
+class Metricas:
+    # Temporizadores y contadores agrupados por familia y etiqueta ("operacion" / "recomendar_peliculas"),
+    # más medidores que se calculan al exportar. Con muestreo < 1 solo se cronometra esa fracción
+    # de las consultas; las etapas de construcción y los contadores se registran siempre.
+
+    def __init__(self, muestreo=1.0, tamano_ventana=1024):
+        self.muestreo = muestreo
+        self.tamano_ventana = tamano_ventana
+        self.temporizadores = {}
+        self.contadores = {}
+        self.medidores = []
+        self._bloqueo = threading.Lock()
+
+    def registrar_duracion(self, familia, etiqueta, segundos):
+        with self._bloqueo:
+            temporizador = self.temporizadores.get((familia, etiqueta))
+            if temporizador is None:
+                temporizador = self.temporizadores[(familia, etiqueta)] = _Temporizador(self.tamano_ventana)
+            temporizador.registrar(segundos)
+
+    @contextmanager
+    def cronometro(self, familia, etiqueta, muestreado=False):
+        if muestreado and self.muestreo < 1.0 and random.random() >= self.muestreo:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_duracion(familia, etiqueta, time.perf_counter() - inicio)
+
+    def contar(self, familia, etiqueta, cantidad=1):
+        with self._bloqueo:
+            self.contadores[(familia, etiqueta)] = self.contadores.get((familia, etiqueta), 0) + cantidad
+
+    def agregar_medidores(self, funcion):
+        # `funcion()` devuelve {familia: {etiqueta: valor}} con el valor actual
+        self.medidores.append(funcion)
+
+    def reiniciar(self):
+        with self._bloqueo:
+            self.temporizadores.clear()
+            self.contadores.clear()
+
+    def _agrupar(self):
+        with self._bloqueo:
+            temporizadores = {clave: temporizador.resumen() for clave, temporizador in self.temporizadores.items()}
+            contadores = dict(self.contadores)
+        medidores = {}
+        for funcion in self.medidores:
+            for familia, valores in funcion().items():
+                medidores.setdefault(familia, {}).update(valores)
+        return temporizadores, contadores, medidores
+
+    def como_dict(self):
+        temporizadores, contadores, medidores = self._agrupar()
+        resultado = {'muestreo': self.muestreo, 'temporizadores': {}, 'contadores': {}, 'medidores': medidores}
+        for (familia, etiqueta), resumen in sorted(temporizadores.items()):
+            resultado['temporizadores'].setdefault(familia, {})[etiqueta] = resumen
+        for (familia, etiqueta), valor in sorted(contadores.items()):
+            resultado['contadores'].setdefault(familia, {})[etiqueta] = valor
+        return resultado
+
+    def como_prometheus(self):
+        # Formato de texto de Prometheus: los temporizadores como summary y los medidores como gauge
+        temporizadores, contadores, medidores = self._agrupar()
+        lineas = []
+
+        familias = sorted({familia for familia, _ in temporizadores})
+        for familia in familias:
+            nombre = f'{PREFIJO_PROMETHEUS}_{familia}_segundos'
+            lineas.append(f'# TYPE {nombre} summary')
+            for (otra, etiqueta), resumen in sorted(temporizadores.items()):
+                if otra != familia:
+                    continue
+                etiquetas = f'{familia}="{etiqueta}"'
+                lineas.append(f'{nombre}{{{etiquetas},quantile="0.5"}} {resumen["p50_ms"] / 1000:.9g}')
+                lineas.append(f'{nombre}{{{etiquetas},quantile="0.99"}} {resumen["p99_ms"] / 1000:.9g}')
+                lineas.append(f'{nombre}_sum{{{etiquetas}}} {resumen["suma_s"]:.9g}')
+                lineas.append(f'{nombre}_count{{{etiquetas}}} {resumen["cuenta"]}')
+
+        for familia in sorted({familia for familia, _ in contadores}):
+            nombre = f'{PREFIJO_PROMETHEUS}_{familia}_total'
+            lineas.append(f'# TYPE {nombre} counter')
+            for (otra, etiqueta), valor in sorted(contadores.items()):
+                if otra == familia:
+                    lineas.append(f'{nombre}{{tipo="{etiqueta}"}} {valor}')
+
+        for familia, valores in sorted(medidores.items()):
+            nombre = f'{PREFIJO_PROMETHEUS}_{familia}'
+            lineas.append(f'# TYPE {nombre} gauge')
+            for etiqueta, valor in sorted(valores.items()):
+                lineas.append(f'{nombre}{{nombre="{etiqueta}"}} {valor}')
+        return '\n'.join(lineas) + '\n'
+
+
+def medir_operacion(funcion):
+    # Cronometra un método público de un objeto con atributo `metricas` (muestreado)
+    @functools.wraps(funcion)
+    def envoltura(self, *argumentos, **opciones):
+        with self.metricas.cronometro('operacion', funcion.__name__, muestreado=True):
+            return funcion(self, *argumentos, **opciones)
+    return envoltura
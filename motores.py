@@ -0,0 +1,543 @@
+import numpy as np
+
+# Si los filtros dejan menos de esta fracción del catálogo, se puntúan solo los candidatos
+FRACCION_FILTRO_SELECTIVO = 0.25
+
+
+def _seleccionar_top_k(puntuaciones, k):
+    # Selección parcial con argpartition y orden solo de los k candidatos, fila a fila
+    if k == 0:
+        vacio = np.empty((puntuaciones.shape[0], 0))
+        return vacio.astype(np.int32), vacio.astype(np.float32)
+    candidatos = np.argpartition(-puntuaciones, k - 1, axis=1)[:, :k]
+    puntuaciones_top = np.take_along_axis(puntuaciones, candidatos, axis=1)
+    orden = np.argsort(-puntuaciones_top, axis=1, kind='stable')
+    return np.take_along_axis(candidatos, orden, axis=1), np.take_along_axis(puntuaciones_top, orden, axis=1)
+
+
+def _normalizar_filas(vectores):
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    normas[normas == 0] = 1
+    return np.ascontiguousarray(vectores / normas, dtype=np.float32)
+
+
+def _normalizar_vector(vector):
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma else vector
+
+
+class Motor:
+    # Interfaz común de los motores de similitud. Cada motor puntúa filas del estado del catálogo;
+    # el top-k, los filtros y el atajo de vecinos precalculados se resuelven aquí igual para todos.
+    nombre = None
+
+    def puntuaciones(self, estado, indices):
+        # Similitud de cada fila de `indices` con todo el catálogo, forma (len(indices), N)
+        raise NotImplementedError
+
+    def puntuaciones_candidatos(self, estado, indice, candidatos):
+        raise NotImplementedError
+
+    def similitud(self, estado, indice1, indice2):
+        raise NotImplementedError
+
+    def similitud_matriz(self, estado, indices):
+        # Similitud de cada par de filas de `indices`, forma (len(indices), len(indices))
+        return np.array([self.puntuaciones_candidatos(estado, indice, indices) for indice in indices])
+
+    def memoria_bytes(self, estado):
+        raise NotImplementedError
+
+    def puntuaciones_perfil(self, estado, indices, pesos):
+        # Similitud de todo el catálogo con el perfil: el centroide de las filas `indices` ponderado por `pesos`
+        raise NotImplementedError
+
+    def actualizar(self, anterior, nuevo, cambiadas, mapa):
+        # Lleva lo que el motor guarda en `anterior.modelos` al estado nuevo tras una actualización incremental
+        pass
+
+    def _vecinos_precalculados(self, estado, indice, k, mascara):
+        return None
+
+    def vecinos(self, estado, indices, k):
+        indices = np.asarray(indices, dtype=np.int64)
+        k = max(min(k, len(estado.df) - 1), 0)
+        puntuaciones = np.array(self.puntuaciones(estado, indices))
+        puntuaciones[np.arange(len(indices)), indices] = -np.inf
+        return _seleccionar_top_k(puntuaciones, k)
+
+    def vecinos_perfil(self, estado, indices, pesos, k):
+        # Top-k del catálogo frente al perfil, sin las películas que lo forman
+        puntuaciones = np.array(self.puntuaciones_perfil(estado, indices, pesos), dtype=np.float64)
+        puntuaciones[indices] = -np.inf
+        k = max(min(k, len(puntuaciones) - len(np.unique(indices))), 0)
+        seleccion, mejores = _seleccionar_top_k(puntuaciones[np.newaxis, :], k)
+        return seleccion[0], mejores[0]
+
+    def vecinos_filtrados(self, estado, indice, k, candidatos):
+        # Los filtros se convierten en candidatos antes del top-k, así que se devuelven exactamente
+        # k resultados válidos (o todos los candidatos si hay menos)
+        candidatos = candidatos[candidatos != indice]
+        k = min(k, len(candidatos))
+        total = len(estado.df)
+
+        if len(candidatos) < FRACCION_FILTRO_SELECTIVO * total:
+            puntuaciones = self.puntuaciones_candidatos(estado, indice, candidatos)
+            seleccion, puntuaciones = _seleccionar_top_k(puntuaciones[np.newaxis, :], k)
+            return candidatos[seleccion[0]], puntuaciones[0]
+
+        mascara = np.zeros(total, dtype=bool)
+        mascara[candidatos] = True
+        atajo = self._vecinos_precalculados(estado, indice, k, mascara)
+        if atajo is not None:
+            return atajo
+
+        puntuaciones = np.array(self.puntuaciones(estado, [indice])[0])
+        puntuaciones[~mascara] = -np.inf
+        seleccion, puntuaciones = _seleccionar_top_k(puntuaciones[np.newaxis, :], k)
+        return seleccion[0], puntuaciones[0]
+
+
+class MotorTfidf(Motor):
+    # Similitud de coseno exacta sobre los vectores TF-IDF; usa la matriz densa o el índice de
+    # vecinos del estado cuando existen
+    nombre = 'tfidf'
+
+    def puntuaciones(self, estado, indices):
+        if estado.matriz_similitud is not None:
+            return estado.matriz_similitud[indices]
+        return (estado.matriz_tfidf[indices] @ estado.matriz_tfidf.T).toarray()
+
+    def puntuaciones_candidatos(self, estado, indice, candidatos):
+        if estado.matriz_similitud is not None:
+            return np.asarray(estado.matriz_similitud[indice][candidatos], dtype=np.float64)
+        return (estado.matriz_tfidf[candidatos] @ estado.matriz_tfidf[indice].T).toarray().ravel()
+
+    def puntuaciones_perfil(self, estado, indices, pesos):
+        # El perfil es un vector denso de tantos términos como el vocabulario; se normaliza para que
+        # la puntuación sea el coseno con el perfil
+        perfil = _normalizar_vector(estado.matriz_tfidf[indices].T @ pesos)
+        return estado.matriz_tfidf @ perfil
+
+    def vecinos(self, estado, indices, k):
+        k = max(min(k, len(estado.df) - 1), 0)
+        if estado.indices_vecinos is not None and k <= estado.indices_vecinos.shape[1]:
+            indices = np.asarray(indices, dtype=np.int64)
+            return estado.indices_vecinos[indices, :k], estado.puntuaciones_vecinos[indices, :k]
+        return super().vecinos(estado, indices, k)
+
+    def _vecinos_precalculados(self, estado, indice, k, mascara):
+        # Con filtros poco selectivos suele bastar con la lista de vecinos precalculada
+        if estado.indices_vecinos is None:
+            return None
+        vecinos = np.asarray(estado.indices_vecinos[indice])
+        validos = mascara[vecinos]
+        if validos.sum() < k:
+            return None
+        return vecinos[validos][:k], np.asarray(estado.puntuaciones_vecinos[indice])[validos][:k]
+
+    def similitud(self, estado, indice1, indice2):
+        if estado.matriz_similitud is not None:
+            return estado.matriz_similitud[indice1][indice2]
+        if indice1 != indice2 and estado.indices_vecinos is not None:
+            posicion = np.flatnonzero(estado.indices_vecinos[indice1] == indice2)
+            if posicion.size:
+                return float(estado.puntuaciones_vecinos[indice1, posicion[0]])
+        # Par fuera del índice: se calcula a partir de las filas TF-IDF
+        return float(estado.matriz_tfidf[indice1].multiply(estado.matriz_tfidf[indice2]).sum())
+
+    def similitud_matriz(self, estado, indices):
+        if estado.matriz_similitud is not None:
+            return np.asarray(estado.matriz_similitud[np.ix_(indices, indices)], dtype=np.float64)
+        filas = estado.matriz_tfidf[indices]
+        return (filas @ filas.T).toarray()
+
+    def memoria_bytes(self, estado):
+        matriz = estado.matriz_tfidf
+        total = matriz.data.nbytes + matriz.indices.nbytes + matriz.indptr.nbytes
+        for arreglo in (estado.matriz_similitud, estado.indices_vecinos, estado.puntuaciones_vecinos):
+            if arreglo is not None:
+                total += arreglo.nbytes
+        return int(total)
+
+
+class MotorLSA(Motor):
+    # Proyección de los vectores TF-IDF a `dimension` componentes con SVD truncada (LSA).
+    # Los vectores se guardan normalizados en float32 y contiguos, así que las puntuaciones
+    # son productos matriz-vector y matriz-matriz de BLAS. En estado.modelos['lsa'] queda
+    # (vectores N×d, componentes d×términos); las componentes permiten proyectar filas nuevas.
+    nombre = 'lsa'
+
+    def __init__(self, dimension=128, semilla=0):
+        self.dimension = dimension
+        self.semilla = semilla
+
+    def ajustar(self, matriz_tfidf):
+        from sklearn.decomposition import TruncatedSVD
+
+        filas, terminos = matriz_tfidf.shape
+        dimension = min(self.dimension, filas, terminos - 1)
+        if dimension < 1:
+            return np.zeros((filas, 0), dtype=np.float32), np.zeros((0, terminos), dtype=np.float32)
+        svd = TruncatedSVD(n_components=dimension, random_state=self.semilla)
+        vectores = svd.fit_transform(matriz_tfidf)
+        return _normalizar_filas(vectores), np.ascontiguousarray(svd.components_, dtype=np.float32)
+
+    def proyectar(self, componentes, filas_tfidf):
+        return _normalizar_filas(np.asarray(filas_tfidf @ componentes.T))
+
+    def modelo(self, estado):
+        # Si el estado aún no tiene vectores LSA (p. ej. tras reconstruir) se ajustan en la primera consulta
+        modelo = estado.modelos.get(self.nombre)
+        if modelo is None:
+            modelo = estado.modelos[self.nombre] = self.ajustar(estado.matriz_tfidf)
+        return modelo
+
+    def actualizar(self, anterior, nuevo, cambiadas, mapa):
+        # Las filas nuevas o modificadas se proyectan con las componentes ya ajustadas (fold-in);
+        # el vocabulario no cambia en una actualización incremental, así que la proyección es válida
+        modelo = anterior.modelos.get(self.nombre)
+        if modelo is None:
+            return
+        vectores, componentes = modelo
+        total = nuevo.matriz_tfidf.shape[0]
+        actualizados = np.zeros((total, vectores.shape[1]), dtype=np.float32)
+        if mapa is not None:
+            conservadas = np.flatnonzero(mapa >= 0)
+            actualizados[mapa[conservadas]] = vectores[conservadas]
+        else:
+            actualizados[:vectores.shape[0]] = vectores
+        if len(cambiadas):
+            actualizados[cambiadas] = self.proyectar(componentes, nuevo.matriz_tfidf[cambiadas])
+        nuevo.modelos[self.nombre] = (actualizados, componentes)
+
+    def puntuaciones(self, estado, indices):
+        vectores, _ = self.modelo(estado)
+        return vectores[indices] @ vectores.T
+
+    def puntuaciones_candidatos(self, estado, indice, candidatos):
+        vectores, _ = self.modelo(estado)
+        return vectores[candidatos] @ vectores[indice]
+
+    def similitud(self, estado, indice1, indice2):
+        vectores, _ = self.modelo(estado)
+        return float(vectores[indice1] @ vectores[indice2])
+
+    def similitud_matriz(self, estado, indices):
+        vectores, _ = self.modelo(estado)
+        filas = np.asarray(vectores[indices], dtype=np.float64)
+        return filas @ filas.T
+
+    def vector_perfil(self, estado, indices, pesos):
+        vectores, _ = self.modelo(estado)
+        return _normalizar_vector(pesos @ np.asarray(vectores[indices], dtype=np.float64)).astype(np.float32)
+
+    def puntuaciones_perfil(self, estado, indices, pesos):
+        vectores, _ = self.modelo(estado)
+        return vectores @ self.vector_perfil(estado, indices, pesos)
+
+    def memoria_bytes(self, estado):
+        vectores, componentes = self.modelo(estado)
+        return int(vectores.nbytes + componentes.nbytes)
+
+
+def _asignar_listas(vectores, centroides, tamano_bloque=4096):
+    # Centroide más cercano (mayor producto escalar) de cada vector, por bloques para acotar la memoria
+    asignacion = np.empty(len(vectores), dtype=np.int32)
+    for inicio in range(0, len(vectores), tamano_bloque):
+        puntuaciones = np.asarray(vectores[inicio:inicio + tamano_bloque]) @ centroides.T
+        asignacion[inicio:inicio + tamano_bloque] = np.argmax(puntuaciones, axis=1)
+    return asignacion
+
+
+def _kmeans_esferico(vectores, listas, iteraciones, generador):
+    # k-means sobre vectores normalizados: los centroides se renormalizan en cada iteración y las
+    # listas vacías se vuelven a sembrar con un vector al azar de la muestra
+    centroides = np.array(vectores[generador.choice(len(vectores), listas, replace=False)], dtype=np.float32)
+    for _ in range(iteraciones):
+        asignacion = _asignar_listas(vectores, centroides)
+        orden = np.argsort(asignacion, kind='stable')
+        ocupadas, inicios = np.unique(asignacion[orden], return_index=True)
+        centroides[ocupadas] = np.add.reduceat(vectores[orden], inicios, axis=0)
+        vacias = np.setdiff1d(np.arange(listas), ocupadas)
+        if len(vacias):
+            centroides[vacias] = vectores[generador.choice(len(vectores), len(vacias))]
+        centroides = _normalizar_filas(centroides)
+    return centroides
+
+
+class MotorIVF(Motor):
+    # Índice aproximado de tipo IVF sobre los vectores LSA: los vectores se reparten en `listas`
+    # grupos con k-means esférico y cada consulta solo puntúa las `sondas` listas cuyos centroides
+    # están más cerca, de modo que el coste es O(listas + sondas·N/listas) en lugar de O(N).
+    # Más sondas, más recall y más coste; sondas == listas equivale a la búsqueda exacta sobre LSA.
+    # En estado.modelos['ivf'] queda (centroides, asignacion, orden, inicios): `orden` son las filas
+    # agrupadas por lista y la lista l ocupa orden[inicios[l]:inicios[l + 1]].
+    nombre = 'ivf'
+    MUESTRA_POR_LISTA = 32
+    ITERACIONES = 10
+
+    def __init__(self, lsa, listas=None, sondas=16, semilla=0):
+        self.lsa = lsa
+        self.listas = listas
+        self.sondas = sondas
+        self.semilla = semilla
+
+    def _num_listas(self, total):
+        # Por defecto ~4·√N listas, el punto habitual entre coste de los centroides y tamaño de las listas
+        listas = self.listas if self.listas is not None else int(4 * np.sqrt(total))
+        return int(min(max(listas, 1), max(total, 1)))
+
+    @staticmethod
+    def indice_desde_asignacion(centroides, asignacion):
+        orden = np.argsort(asignacion, kind='stable').astype(np.int32)
+        inicios = np.searchsorted(asignacion[orden], np.arange(len(centroides) + 1)).astype(np.int64)
+        return centroides, asignacion, orden, inicios
+
+    def ajustar(self, vectores):
+        total = len(vectores)
+        listas = self._num_listas(total)
+        generador = np.random.default_rng(self.semilla)
+        if total == 0 or vectores.shape[1] == 0:
+            centroides = np.zeros((listas if total else 0, vectores.shape[1]), dtype=np.float32)
+            return self.indice_desde_asignacion(centroides, np.zeros(total, dtype=np.int32))
+        # Los centroides se entrenan con una muestra; luego se asignan todas las filas
+        tamano_muestra = min(total, listas * self.MUESTRA_POR_LISTA)
+        muestra = np.asarray(vectores[np.sort(generador.choice(total, tamano_muestra, replace=False))])
+        centroides = _kmeans_esferico(muestra, listas, self.ITERACIONES, generador)
+        return self.indice_desde_asignacion(centroides, _asignar_listas(vectores, centroides))
+
+    def modelo(self, estado):
+        vectores, _ = self.lsa.modelo(estado)
+        indice = estado.modelos.get(self.nombre)
+        if indice is None:
+            indice = estado.modelos[self.nombre] = self.ajustar(vectores)
+        return vectores, indice
+
+    def actualizar(self, anterior, nuevo, cambiadas, mapa):
+        # Las filas conservadas mantienen su lista; las nuevas o modificadas se asignan al centroide
+        # más cercano. Los centroides no se reentrenan hasta reconstruir.
+        indice = anterior.modelos.get(self.nombre)
+        lsa = nuevo.modelos.get(self.lsa.nombre)
+        if indice is None or lsa is None:
+            return
+        centroides, asignacion = indice[0], indice[1]
+        total = nuevo.matriz_tfidf.shape[0]
+        nueva = np.zeros(total, dtype=np.int32)
+        if mapa is not None:
+            conservadas = np.flatnonzero(mapa >= 0)
+            nueva[mapa[conservadas]] = asignacion[conservadas]
+        else:
+            nueva[:len(asignacion)] = asignacion
+        if len(cambiadas):
+            nueva[cambiadas] = _asignar_listas(lsa[0][cambiadas], centroides)
+        nuevo.modelos[self.nombre] = self.indice_desde_asignacion(centroides, nueva)
+
+    def _candidatos(self, indice_ivf, consulta, minimo):
+        # Filas de las `sondas` listas más cercanas; si no suman `minimo` se añaden listas en orden
+        centroides, _, orden, inicios = indice_ivf
+        cercanas = np.argsort(-(centroides @ consulta), kind='stable')
+        acumulado = np.cumsum(inicios[cercanas + 1] - inicios[cercanas])
+        sondas = max(min(self.sondas, len(cercanas)), int(np.searchsorted(acumulado, minimo)) + 1)
+        return np.concatenate([orden[inicios[lista]:inicios[lista + 1]] for lista in cercanas[:sondas]])
+
+    def vecinos(self, estado, indices, k):
+        vectores, indice_ivf = self.modelo(estado)
+        indices = np.asarray(indices, dtype=np.int64)
+        k = max(min(k, len(estado.df) - 1), 0)
+        resultado_indices = np.empty((len(indices), k), dtype=np.int32)
+        resultado_puntuaciones = np.empty((len(indices), k), dtype=np.float32)
+        for posicion, indice in enumerate(indices):
+            candidatos = self._candidatos(indice_ivf, vectores[indice], k + 1)
+            candidatos = candidatos[candidatos != indice]
+            puntuaciones = np.asarray(vectores[candidatos]) @ vectores[indice]
+            seleccion, mejores = _seleccionar_top_k(puntuaciones[np.newaxis, :], k)
+            resultado_indices[posicion] = candidatos[seleccion[0]]
+            resultado_puntuaciones[posicion] = mejores[0]
+        return resultado_indices, resultado_puntuaciones
+
+    def _vecinos_precalculados(self, estado, indice, k, mascara):
+        # Con filtros poco selectivos se puntúan solo los candidatos de las listas sondeadas que los
+        # cumplen; si no llegan a k se cae a la puntuación completa sobre LSA
+        vectores, indice_ivf = self.modelo(estado)
+        candidatos = self._candidatos(indice_ivf, vectores[indice], k + 1)
+        candidatos = candidatos[mascara[candidatos] & (candidatos != indice)]
+        if len(candidatos) < k:
+            return None
+        puntuaciones = np.asarray(vectores[candidatos]) @ vectores[indice]
+        seleccion, mejores = _seleccionar_top_k(puntuaciones[np.newaxis, :], k)
+        return candidatos[seleccion[0]], mejores[0]
+
+    def vecinos_perfil(self, estado, indices, pesos, k):
+        # El perfil se busca en el índice como cualquier otra consulta; las semillas se descartan después
+        vectores, indice_ivf = self.modelo(estado)
+        semillas = np.unique(indices)
+        k = max(min(k, len(vectores) - len(semillas)), 0)
+        perfil = self.lsa.vector_perfil(estado, indices, pesos)
+        candidatos = self._candidatos(indice_ivf, perfil, k + len(semillas))
+        candidatos = candidatos[~np.isin(candidatos, semillas)]
+        puntuaciones = np.asarray(vectores[candidatos]) @ perfil
+        seleccion, mejores = _seleccionar_top_k(puntuaciones[np.newaxis, :], k)
+        return candidatos[seleccion[0]], mejores[0]
+
+    def puntuaciones_perfil(self, estado, indices, pesos):
+        return self.lsa.puntuaciones_perfil(estado, indices, pesos)
+
+    def puntuaciones(self, estado, indices):
+        return self.lsa.puntuaciones(estado, indices)
+
+    def puntuaciones_candidatos(self, estado, indice, candidatos):
+        return self.lsa.puntuaciones_candidatos(estado, indice, candidatos)
+
+    def similitud(self, estado, indice1, indice2):
+        return self.lsa.similitud(estado, indice1, indice2)
+
+    def similitud_matriz(self, estado, indices):
+        return self.lsa.similitud_matriz(estado, indices)
+
+    def memoria_bytes(self, estado):
+        _, indice_ivf = self.modelo(estado)
+        return self.lsa.memoria_bytes(estado) + int(sum(arreglo.nbytes for arreglo in indice_ivf))
+
+
+class MotorCampos(Motor):
+    # Una matriz TF-IDF por campo (género, director, reparto, descripción), cada una con su vocabulario
+    # e idf y filas normalizadas, guardadas una junto a otra en una sola matriz dispersa. La similitud
+    # es la media ponderada de los cosenos por campo: los pesos escalan las columnas de cada campo en
+    # la fila de consulta, así que cambiar los pesos no reajusta nada. En estado.modelos['campos'] queda
+    # (matriz N×términos, limites, vectorizadores): las columnas del campo i son limites[i]:limites[i + 1].
+    # Al cargar artefactos cada vectorizador llega como (términos, idf) y se reconstruye al necesitarlo.
+    nombre = 'campos'
+    CAMPOS = ('genre', 'director', 'cast', 'description')
+
+    def __init__(self, crear_vectorizador, pesos=None):
+        self.crear_vectorizador = crear_vectorizador
+        self.pesos = self._validar_pesos(pesos)
+
+    def _validar_pesos(self, pesos):
+        # Los campos que no aparecen en `pesos` pesan 1
+        pesos = dict(pesos or {})
+        desconocidos = set(pesos) - set(self.CAMPOS)
+        if desconocidos:
+            raise ValueError(f"Campos sin matriz propia: {', '.join(sorted(desconocidos))}")
+        valores = np.array([float(pesos.get(campo, 1.0)) for campo in self.CAMPOS])
+        if not np.isfinite(valores).all() or (valores < 0).any() or valores.sum() <= 0:
+            raise ValueError("Los pesos deben ser números no negativos y no todos cero")
+        return valores / valores.sum()
+
+    def con_pesos(self, pesos):
+        # Copia ligera con otros pesos que comparte las matrices ajustadas del estado
+        copia = MotorCampos.__new__(MotorCampos)
+        copia.crear_vectorizador = self.crear_vectorizador
+        copia.pesos = self._validar_pesos(pesos)
+        return copia
+
+    @classmethod
+    def _textos(cls, df, campo):
+        return [valor if isinstance(valor, str) else '' for valor in df[campo].to_numpy(dtype=object)]
+
+    @staticmethod
+    def guardable(vectorizador):
+        # (términos en orden de columna, idf) de un vectorizador ajustado o ya en esa forma
+        if vectorizador is None:
+            return [], np.empty(0)
+        if isinstance(vectorizador, tuple):
+            return list(vectorizador[0]), vectorizador[1]
+        terminos = sorted(vectorizador.vocabulary_, key=vectorizador.vocabulary_.get)
+        return terminos, vectorizador.idf_
+
+    def _vectorizador(self, guardado):
+        terminos, idf = guardado
+        vectorizador = self.crear_vectorizador()
+        vectorizador.vocabulary_ = {termino: indice for indice, termino in enumerate(terminos)}
+        vectorizador.idf_ = np.asarray(idf)
+        return vectorizador
+
+    def _transformar(self, vectorizadores, df):
+        from scipy import sparse
+
+        partes = []
+        for posicion, (campo, vectorizador) in enumerate(zip(self.CAMPOS, vectorizadores)):
+            if isinstance(vectorizador, tuple):
+                vectorizador = vectorizadores[posicion] = self._vectorizador(vectorizador)
+            if vectorizador is None:
+                partes.append(sparse.csr_matrix((len(df), 0), dtype=np.float64))
+            else:
+                partes.append(vectorizador.transform(self._textos(df, campo)))
+        return sparse.hstack(partes, format='csr')
+
+    def ajustar(self, df):
+        from scipy import sparse
+
+        partes, vectorizadores = [], []
+        for campo in self.CAMPOS:
+            vectorizador = self.crear_vectorizador()
+            try:
+                partes.append(vectorizador.fit_transform(self._textos(df, campo)))
+            except ValueError:
+                # Campo vacío o solo con palabras vacías: no aporta columnas
+                vectorizador = None
+                partes.append(sparse.csr_matrix((len(df), 0), dtype=np.float64))
+            vectorizadores.append(vectorizador)
+        limites = np.cumsum([0] + [parte.shape[1] for parte in partes])
+        return sparse.hstack(partes, format='csr'), limites, vectorizadores
+
+    def modelo(self, estado):
+        modelo = estado.modelos.get(self.nombre)
+        if modelo is None:
+            modelo = estado.modelos[self.nombre] = self.ajustar(estado.df)
+        return modelo
+
+    def actualizar(self, anterior, nuevo, cambiadas, mapa):
+        # Las filas conservadas se copian; las nuevas o modificadas se vectorizan con los vocabularios ya ajustados
+        from scipy import sparse
+
+        modelo = anterior.modelos.get(self.nombre)
+        if modelo is None:
+            return
+        matriz, limites, vectorizadores = modelo
+        total = len(nuevo.df)
+        origen = np.full(total, -1, dtype=np.int64)
+        if mapa is not None:
+            conservadas = np.flatnonzero(mapa >= 0)
+            origen[mapa[conservadas]] = conservadas
+        else:
+            origen[:matriz.shape[0]] = np.arange(matriz.shape[0])
+        if len(cambiadas):
+            origen[cambiadas] = matriz.shape[0] + np.arange(len(cambiadas))
+            matriz = sparse.vstack([matriz, self._transformar(vectorizadores, nuevo.df.iloc[cambiadas])], format='csr')
+        nuevo.modelos[self.nombre] = (matriz[origen], limites, vectorizadores)
+
+    def _consulta(self, matriz, limites, filas):
+        # Filas de consulta con las columnas de cada campo multiplicadas por su peso
+        pesos_columnas = np.repeat(self.pesos, np.diff(limites))
+        return matriz[filas].multiply(pesos_columnas).tocsr()
+
+    def puntuaciones(self, estado, indices):
+        matriz, limites, _ = self.modelo(estado)
+        return (self._consulta(matriz, limites, indices) @ matriz.T).toarray()
+
+    def puntuaciones_candidatos(self, estado, indice, candidatos):
+        matriz, limites, _ = self.modelo(estado)
+        return (matriz[candidatos] @ self._consulta(matriz, limites, [indice]).T).toarray().ravel()
+
+    def similitud(self, estado, indice1, indice2):
+        matriz, limites, _ = self.modelo(estado)
+        return float(self._consulta(matriz, limites, [indice1]).multiply(matriz[indice2]).sum())
+
+    def similitud_matriz(self, estado, indices):
+        matriz, limites, _ = self.modelo(estado)
+        return (self._consulta(matriz, limites, indices) @ matriz[indices].T).toarray()
+
+    def puntuaciones_perfil(self, estado, indices, pesos):
+        # El centroide se normaliza campo a campo, así que la puntuación sigue siendo la media ponderada
+        # de los cosenos por campo, ahora con el perfil
+        matriz, limites, _ = self.modelo(estado)
+        perfil = matriz[indices].T @ pesos
+        for inicio, fin in zip(limites[:-1], limites[1:]):
+            perfil[inicio:fin] = _normalizar_vector(perfil[inicio:fin])
+        return matriz @ (perfil * np.repeat(self.pesos, np.diff(limites)))
+
+    def memoria_bytes(self, estado):
+        matriz, _, _ = self.modelo(estado)
+        return int(matriz.data.nbytes + matriz.indices.nbytes + matriz.indptr.nbytes)
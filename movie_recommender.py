@@ -1,116 +1,1246 @@
-import pandas as pd
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import warnings
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import nltk
+from cache_resultados import CacheResultados, cachear, clave_consulta
+from estadisticas import EstadisticasCatalogo
+from facetas import IndiceFacetas
+from grupos import AgrupamientoCatalogo
+from indice_titulos import IndiceTitulos
+from metricas import Metricas, medir_operacion
+from motores import MotorCampos, MotorIVF, MotorLSA, MotorTfidf, _seleccionar_top_k
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt', quiet=True)
+# pandas, scipy y scikit-learn se importan dentro de los métodos que los usan: importar este
+# módulo no hace E/S ni carga dependencias pesadas hasta que se construye un recomendador
 
-try:
-    nltk.data.find('corpora/brown')
-except LookupError:
-    nltk.download('brown', quiet=True)
+# Se incrementa cuando cambia el contenido o el formato de los artefactos guardados
+FORMATO_ARTEFACTOS = 7
+
+COLUMNAS_TEXTO = ['genre', 'director', 'cast', 'description']
+COLUMNAS_CATEGORICAS = ['genre', 'director', 'country']
+
+def _hash_archivo(ruta, tamano_lectura=1 << 20):
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(tamano_lectura), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+def _textos_combinados(df):
+    # Genera el texto de género, director, reparto y descripción de cada fila sin guardarlo como columna
+    columnas = [df[columna].to_numpy(dtype=object) for columna in COLUMNAS_TEXTO]
+    for valores in zip(*columnas):
+        yield ' '.join(valor if isinstance(valor, str) else '' for valor in valores)
+
+def _compactar_tipos(df):
+    import pandas as pd
+    
+    for columna in COLUMNAS_CATEGORICAS:
+        if columna in df.columns:
+            df[columna] = df[columna].astype('category')
+    if 'year' in df.columns:
+        anios = pd.to_numeric(df['year'], errors='coerce')
+        df['year'] = anios.astype('int16') if anios.notna().all() else anios.astype('Int16')
+    if 'rating' in df.columns:
+        df['rating'] = pd.to_numeric(df['rating'], errors='coerce').astype('float32')
+    return df
+
+def _concatenar(partes):
+    # Unifica las categorías antes de concatenar para que las columnas sigan siendo categóricas
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+    
+    partes = [parte for parte in partes if len(parte.columns)]
+    for columna in COLUMNAS_CATEGORICAS:
+        if all(isinstance(parte[columna].dtype, pd.CategoricalDtype) for parte in partes if columna in parte.columns):
+            categorias = union_categoricals(
+                [parte[columna] for parte in partes if columna in parte.columns], ignore_order=True
+            ).categories
+            for parte in partes:
+                if columna in parte.columns:
+                    parte[columna] = parte[columna].cat.set_categories(categorias)
+    return pd.concat(partes, ignore_index=True)
+
+def _reemplazar_fila(matriz, posicion, fila):
+    # Cambia una fila de una matriz CSR empalmando sus arreglos: una sola copia de data e indices,
+    # sin recortar ni apilar submatrices
+    from scipy import sparse
+    
+    fila = sparse.csr_matrix(fila)
+    inicio, fin = int(matriz.indptr[posicion]), int(matriz.indptr[posicion + 1])
+    data = np.concatenate((matriz.data[:inicio], fila.data.astype(matriz.data.dtype, copy=False), matriz.data[fin:]))
+    indices = np.concatenate(
+        (matriz.indices[:inicio], fila.indices.astype(matriz.indices.dtype, copy=False), matriz.indices[fin:])
+    )
+    tipo_indptr = np.int64 if len(data) > np.iinfo(np.int32).max else matriz.indptr.dtype
+    indptr = matriz.indptr.astype(tipo_indptr)
+    indptr[posicion + 1:] += fila.nnz - (fin - inicio)
+    return sparse.csr_matrix((data, indices, indptr), shape=matriz.shape)
+
+def _rss_pico_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa kilobytes y macOS bytes
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+def cargar_csv(ruta_csv, tamano_chunk=50000):
+    # Lee el CSV por bloques con tipos compactos: categorías para género, director y país,
+    # int16 para el año y float32 para el rating
+    import pandas as pd
+    
+    rss_inicial = _rss_pico_bytes()
+    partes = [_compactar_tipos(parte) for parte in pd.read_csv(ruta_csv, chunksize=tamano_chunk)]
+    df = _concatenar(partes) if partes else pd.read_csv(ruta_csv)
+    del partes
+    
+    rss_final = _rss_pico_bytes()
+    bytes_csv = os.path.getsize(ruta_csv)
+    aumento = rss_final - rss_inicial if rss_final is not None else None
+    estadisticas = {
+        'filas': len(df),
+        'bytes_csv': bytes_csv,
+        'memoria_df_bytes': int(df.memory_usage(deep=True).sum()),
+        'rss_pico_bytes': rss_final,
+        'aumento_rss_pico_bytes': aumento,
+        'multiplo_tamano_csv': round(aumento / bytes_csv, 2) if aumento is not None and bytes_csv else None
+    }
+    return df, estadisticas
+
+def _filas_a_dicts(df_filas):
+    # Se arma columna a columna: to_dict('records') pasa por astype/round de pandas y domina el
+    # coste de una recomendación. float32 -> float de Python con el redondeo con el que se guardó
+    # (9.3 y no 9.300000190734863). Los datos que faltan (NaN, pd.NA) quedan como None, que JSON acepta
+    columnas = {}
+    for columna, serie in df_filas.items():
+        if serie.dtype == np.float32:
+            valores = np.round(serie.to_numpy(dtype=np.float64, na_value=np.nan), 4).tolist()
+        else:
+            valores = serie.tolist()
+        if serie.hasnans:
+            valores = [None if faltante else valor for valor, faltante in zip(valores, serie.isna().tolist())]
+        columnas[columna] = valores
+    nombres = list(columnas)
+    return [dict(zip(nombres, valores)) for valores in zip(*columnas.values())]
+
+def _matriz_a_listas(matriz, tipo=float):
+    # Listas de Python con None donde falta el dato (rating o año desconocido), que JSON acepta
+    return [[None if valor != valor else tipo(valor) for valor in fila] for fila in matriz.tolist()]
+
+def _calcular_vecinos(matriz, filas, k, tamano_bloque, progreso=None):
+    # Las filas TF-IDF están normalizadas (L2), así que el producto escalar es la similitud de coseno
+    filas = np.asarray(filas, dtype=np.int64)
+    indices = np.empty((len(filas), k), dtype=np.int32)
+    puntuaciones = np.empty((len(filas), k), dtype=np.float32)
+    if k == 0 or len(filas) == 0:
+        return indices, puntuaciones
+    
+    traspuesta = matriz.T.tocsr()
+    inicio_reloj = time.perf_counter()
+    for inicio in range(0, len(filas), tamano_bloque):
+        bloque_filas = filas[inicio:inicio + tamano_bloque]
+        bloque = (matriz[bloque_filas] @ traspuesta).toarray()
+        bloque[np.arange(len(bloque_filas)), bloque_filas] = -np.inf
+        fin = inicio + len(bloque_filas)
+        indices[inicio:fin], puntuaciones[inicio:fin] = _seleccionar_top_k(bloque, k)
+        if progreso is not None:
+            transcurrido = time.perf_counter() - inicio_reloj
+            progreso(fin, len(filas), transcurrido / fin * (len(filas) - fin))
+    return indices, puntuaciones
+
+class EstadoCatalogo:
+    # Versión inmutable del catálogo. Las actualizaciones construyen un estado nuevo y lo publican
+    # reemplazando una sola referencia, así que una consulta nunca ve un índice a medio actualizar.
+    
+    def __init__(self, df, matriz_tfidf, indice_titulos, vectorizador=None, vectorizador_guardado=None,
+                 matriz_similitud=None, indices_vecinos=None, puntuaciones_vecinos=None, version=0, modelos=None,
+                 identidad=None, matriz_guardada=None):
+        self.df = df
+        self._matriz_tfidf = matriz_tfidf
+        self._matriz_guardada = matriz_guardada
+        self.indice_titulos = indice_titulos
+        self.matriz_similitud = matriz_similitud
+        self.indices_vecinos = indices_vecinos
+        self.puntuaciones_vecinos = puntuaciones_vecinos
+        self.version = version
+        # `version` solo cuenta las actualizaciones de este proceso; `identidad` distingue el contenido
+        # del catálogo entre procesos (p. ej. en la caché compartida en disco). Cada estado publicado
+        # recibe una nueva; el construido desde el CSV y el cargado de artefactos, una reproducible.
+        self.identidad = identidad or uuid.uuid4().hex
+        # Datos propios de cada motor de similitud (p. ej. los vectores LSA), por nombre de motor
+        self.modelos = dict(modelos or {})
+        self._vectorizador = vectorizador
+        self._vectorizador_guardado = vectorizador_guardado
+        self._ids_ordenados = None
+        self._facetas = None
+        self._estadisticas = None
+    
+    @property
+    def facetas(self):
+        # Se construyen en la primera consulta por facetas de cada versión, fuera del camino de escritura
+        if self._facetas is None:
+            self._facetas = IndiceFacetas(self.df)
+        return self._facetas
+    
+    @property
+    def estadisticas(self):
+        # Se calculan al construir el catálogo (o en la primera lectura si se cargó de artefactos) y
+        # cada actualización incremental las hereda aplicando solo las filas que cambian
+        if self._estadisticas is None:
+            self._estadisticas = EstadisticasCatalogo(self.df)
+        return self._estadisticas
+    
+    @property
+    def matriz_tfidf(self):
+        # Al cargar artefactos la matriz dispersa (y scipy) se arma la primera vez que se usa: una
+        # recomendación con los vecinos precalculados no la necesita
+        if self._matriz_tfidf is None and self._matriz_guardada is not None:
+            from scipy import sparse
+            
+            data, indices, indptr, forma = self._matriz_guardada
+            self._matriz_tfidf = sparse.csr_matrix((data, indices, indptr), shape=forma, copy=False)
+        return self._matriz_tfidf
+    
+    @property
+    def vectorizador(self):
+        # Al cargar artefactos el vectorizador (y scikit-learn) se reconstruye solo cuando se necesita
+        if self._vectorizador is None and self._vectorizador_guardado is not None:
+            terminos, idf = self._vectorizador_guardado
+            vectorizador = _nuevo_vectorizador()
+            vectorizador.vocabulary_ = {termino: indice for indice, termino in enumerate(terminos)}
+            vectorizador.idf_ = np.asarray(idf)
+            self._vectorizador = vectorizador
+        return self._vectorizador
+    
+    def posiciones_de_ids(self, ids):
+        if self._ids_ordenados is None:
+            ids_df = self.df['id'].to_numpy()
+            orden = np.argsort(ids_df, kind='stable')
+            self._ids_ordenados = (ids_df[orden], orden)
+        ids_ordenados, orden = self._ids_ordenados
+        ids = np.atleast_1d(np.asarray(ids))
+        posiciones = np.searchsorted(ids_ordenados, ids).clip(max=max(len(ids_ordenados) - 1, 0))
+        encontrados = ids_ordenados[posiciones] == ids if len(ids_ordenados) else np.zeros(len(ids), dtype=bool)
+        return np.where(encontrados, orden[posiciones] if len(orden) else -1, -1)
+
+def _nuevo_vectorizador():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer(stop_words='english', max_features=5000)
 
 class RecomendadorPeliculas:
-    def __init__(self, ruta_csv):
-        self.df = pd.read_csv(ruta_csv)
-        self.vectorizador = None
-        self.matriz_similitud = None
-        self._preparar_datos()
-        self._construir_matriz_similitud()
-    
-    def _preparar_datos(self):
-        self.df['caracteristicas_combinadas'] = (
-            self.df['genre'].fillna('') + ' ' +
-            self.df['director'].fillna('') + ' ' +
-            self.df['cast'].fillna('') + ' ' +
-            self.df['description'].fillna('')
+    def __init__(self, ruta_csv, num_vecinos=None, tamano_bloque=256, ruta_artefactos=None,
+                 tamano_chunk=50000, max_multiplo_memoria=None, procesos=None, progreso=None, metricas=None,
+                 motor='tfidf', dimension_lsa=128, listas_ivf=None, sondas_ivf=16, cache=None, num_grupos=None):
+        self.ruta_csv = ruta_csv
+        # Motor de similitud por defecto: 'tfidf' (exacto), 'lsa' (vectores densos float32 de
+        # dimension_lsa componentes) o 'ivf' (búsqueda aproximada sobre los vectores LSA en listas_ivf
+        # grupos, sondeando sondas_ivf por consulta) o 'campos' (una matriz TF-IDF por campo combinadas
+        # con pesos en cada consulta). Con cualquiera que no sea 'tfidf' no se construye la matriz densa
+        # ni el índice de vecinos TF-IDF.
+        lsa = MotorLSA(dimension_lsa)
+        self.motores = {
+            'tfidf': MotorTfidf(), 'lsa': lsa, 'ivf': MotorIVF(lsa, listas_ivf, sondas_ivf),
+            'campos': MotorCampos(_nuevo_vectorizador),
+        }
+        if motor not in self.motores:
+            raise ValueError(f"Motor desconocido: {motor}")
+        self.motor = motor
+        # Agrupamiento del catálogo para explorar grupos de películas parecidas y acotar búsquedas.
+        # Con num_grupos se calcula al construir el catálogo y se guarda con los artefactos; sin él,
+        # se calcula con ~√(N/2) grupos en la primera consulta que lo necesite
+        self.agrupamiento = AgrupamientoCatalogo(num_grupos)
+        # Tiempos por etapa y por método, contadores de coincidencias de título y memoria del modelo;
+        # se puede pasar un Metricas(muestreo=0.1) para cronometrar solo una fracción de las consultas
+        self.metricas = metricas if metricas is not None else Metricas()
+        self.metricas.agregar_medidores(self._medidores)
+        # Caché de búsquedas, recomendaciones, comparaciones y filtros; por defecto solo en memoria.
+        # CacheResultados(ruta_disco=...) la comparte entre los procesos de la máquina y cache=False la desactiva
+        self.cache = (cache if cache is not None else CacheResultados()) or None
+        if self.cache is not None and self.cache.metricas is None:
+            self.cache.metricas = self.metricas
+        # Las entradas de la caché solo valen para este CSV y esta configuración de motores
+        huella = self._huella_csv(con_hash=False)
+        self._espacio_cache = hashlib.sha256(json.dumps([
+            os.path.abspath(ruta_csv), huella['tamano'], huella['mtime_ns'], num_vecinos,
+            motor, dimension_lsa, listas_ivf, sondas_ivf, num_grupos
+        ]).encode('utf-8')).hexdigest()[:16]
+        # Con num_vecinos se guarda solo el top-k de cada película (memoria O(N·k))
+        # en lugar de la matriz densa N×N
+        self.num_vecinos = num_vecinos
+        self.tamano_bloque = tamano_bloque
+        # Con procesos > 1 las construcciones completas reparten los bloques de filas entre procesos;
+        # progreso(filas_hechas, filas_totales, eta_segundos) informa del avance
+        self.procesos = procesos
+        self.progreso = progreso
+        self._estado = None
+        self.estadisticas_carga = None
+        # Serializa a los escritores; los lectores nunca bloquean
+        self._bloqueo_escritura = threading.Lock()
+        
+        # Con ruta_artefactos se reutiliza el modelo guardado mientras el CSV no cambie
+        if ruta_artefactos is not None:
+            with self.metricas.cronometro('etapa', 'cargar_artefactos'):
+                self._estado = self._cargar_artefactos(ruta_artefactos)
+            if self._estado is not None:
+                return
+        
+        with self.metricas.cronometro('etapa', 'cargar_csv'):
+            df, self.estadisticas_carga = cargar_csv(ruta_csv, tamano_chunk)
+        multiplo = self.estadisticas_carga['multiplo_tamano_csv']
+        if max_multiplo_memoria is not None and multiplo is not None and multiplo > max_multiplo_memoria:
+            warnings.warn(
+                f"La carga de {ruta_csv} elevó el pico de memoria {multiplo} veces su tamaño en disco "
+                f"(máximo {max_multiplo_memoria})"
+            )
+        with self.metricas.cronometro('etapa', 'preparar_datos'):
+            df = self._preparar_datos(df)
+        # El catálogo recién leído depende solo del CSV y la configuración, que ya forman _espacio_cache
+        self._estado = self._construir_estado(df, identidad='csv')
+        
+        if ruta_artefactos is not None:
+            try:
+                self.guardar(ruta_artefactos)
+            except OSError as error:
+                warnings.warn(f"No se pudieron guardar los artefactos en {ruta_artefactos}: {error}")
+    
+    @property
+    def df(self):
+        return self._estado.df
+    
+    @property
+    def version(self):
+        return self._estado.version
+    
+    @property
+    def vectorizador(self):
+        return self._estado.vectorizador
+    
+    @property
+    def matriz_tfidf(self):
+        return self._estado.matriz_tfidf
+    
+    @property
+    def matriz_similitud(self):
+        return self._estado.matriz_similitud
+    
+    @property
+    def indices_vecinos(self):
+        return self._estado.indices_vecinos
+    
+    @property
+    def puntuaciones_vecinos(self):
+        return self._estado.puntuaciones_vecinos
+    
+    @property
+    def indice_titulos(self):
+        return self._estado.indice_titulos
+    
+    def _medidores(self):
+        estado = self._estado
+        if estado is None:
+            return {}
+        matriz = estado.matriz_tfidf
+        memoria = {
+            'dataframe': int(estado.df.memory_usage(index=True, deep=False).sum()),
+            'matriz_tfidf': int(matriz.data.nbytes + matriz.indices.nbytes + matriz.indptr.nbytes),
+            'indice_titulos': int(sum(lista.nbytes for lista in estado.indice_titulos.postings.values())),
+        }
+        for nombre in ('matriz_similitud', 'indices_vecinos', 'puntuaciones_vecinos'):
+            arreglo = getattr(estado, nombre)
+            if arreglo is not None:
+                memoria[nombre] = int(arreglo.nbytes)
+        if 'lsa' in estado.modelos:
+            vectores, componentes = estado.modelos['lsa']
+            memoria['vectores_lsa'] = int(vectores.nbytes)
+            memoria['componentes_lsa'] = int(componentes.nbytes)
+        if 'ivf' in estado.modelos:
+            memoria['indice_ivf'] = int(sum(arreglo.nbytes for arreglo in estado.modelos['ivf']))
+        if 'campos' in estado.modelos:
+            campos = estado.modelos['campos'][0]
+            memoria['matriz_campos'] = int(campos.data.nbytes + campos.indices.nbytes + campos.indptr.nbytes)
+        if 'grupos' in estado.modelos:
+            memoria['grupos'] = int(sum(arreglo.nbytes for arreglo in estado.modelos['grupos'][:4]))
+        medidores = {
+            'memoria_bytes': memoria,
+            'catalogo': {'peliculas': len(estado.df), 'version': estado.version, 'terminos': matriz.shape[1]},
+        }
+        if self.cache is not None:
+            medidores['cache'] = self.cache.estadisticas()
+        return medidores
+    
+    def exportar_metricas(self, formato='json'):
+        # 'json' devuelve un diccionario serializable; 'prometheus', el texto de exposición
+        if formato == 'prometheus':
+            return self.metricas.como_prometheus()
+        if formato != 'json':
+            raise ValueError(f"Formato de métricas desconocido: {formato}")
+        return self.metricas.como_dict()
+    
+    def _huella_csv(self, con_hash=True):
+        estado = os.stat(self.ruta_csv)
+        return {
+            'tamano': estado.st_size,
+            'mtime_ns': estado.st_mtime_ns,
+            'sha256': _hash_archivo(self.ruta_csv) if con_hash else None
+        }
+    
+    def _csv_coincide(self, huella_guardada):
+        huella = self._huella_csv(con_hash=False)
+        if huella['tamano'] != huella_guardada['tamano']:
+            return False
+        if huella['mtime_ns'] == huella_guardada['mtime_ns']:
+            return True
+        return _hash_archivo(self.ruta_csv) == huella_guardada['sha256']
+    
+    @medir_operacion
+    def guardar(self, ruta_artefactos):
+        # Se escribe en un directorio temporal junto al destino y se sustituye con rename,
+        # para que nunca quede a la vista un conjunto de artefactos a medio escribir
+        estado = self._estado
+        ruta_artefactos = os.path.abspath(ruta_artefactos)
+        directorio_padre = os.path.dirname(ruta_artefactos)
+        os.makedirs(directorio_padre, exist_ok=True)
+        temporal = tempfile.mkdtemp(prefix='.artefactos-', dir=directorio_padre)
+        try:
+            matriz = estado.matriz_tfidf.tocsr()
+            np.save(os.path.join(temporal, 'tfidf_data.npy'), matriz.data)
+            np.save(os.path.join(temporal, 'tfidf_indices.npy'), matriz.indices)
+            np.save(os.path.join(temporal, 'tfidf_indptr.npy'), matriz.indptr)
+            np.save(os.path.join(temporal, 'idf.npy'), estado.vectorizador.idf_)
+            terminos = sorted(estado.vectorizador.vocabulary_, key=estado.vectorizador.vocabulary_.get)
+            with open(os.path.join(temporal, 'vocabulario.json'), 'w', encoding='utf-8') as archivo:
+                json.dump(terminos, archivo, ensure_ascii=False)
+            
+            if estado.matriz_similitud is not None:
+                np.save(os.path.join(temporal, 'matriz_similitud.npy'), estado.matriz_similitud)
+            elif estado.indices_vecinos is not None:
+                np.save(os.path.join(temporal, 'vecinos_indices.npy'), estado.indices_vecinos)
+                np.save(os.path.join(temporal, 'vecinos_puntuaciones.npy'), estado.puntuaciones_vecinos)
+            lsa = estado.modelos.get('lsa')
+            if lsa is not None:
+                np.save(os.path.join(temporal, 'lsa_vectores.npy'), lsa[0])
+                np.save(os.path.join(temporal, 'lsa_componentes.npy'), lsa[1])
+            # Del índice IVF bastan los centroides y la lista de cada fila; el orden se rehace al cargar
+            ivf = estado.modelos.get('ivf') if lsa is not None else None
+            if ivf is not None:
+                np.save(os.path.join(temporal, 'ivf_centroides.npy'), ivf[0])
+                np.save(os.path.join(temporal, 'ivf_asignacion.npy'), ivf[1])
+            # Las matrices por campo van juntas; de cada vectorizador se guardan sus términos y su idf
+            campos = estado.modelos.get('campos')
+            if campos is not None:
+                matriz_campos, limites, vectorizadores = campos
+                np.save(os.path.join(temporal, 'campos_data.npy'), matriz_campos.data)
+                np.save(os.path.join(temporal, 'campos_indices.npy'), matriz_campos.indices)
+                np.save(os.path.join(temporal, 'campos_indptr.npy'), matriz_campos.indptr)
+                np.save(os.path.join(temporal, 'campos_limites.npy'), limites)
+                guardados = [MotorCampos.guardable(vectorizador) for vectorizador in vectorizadores]
+                np.save(os.path.join(temporal, 'campos_idf.npy'), np.concatenate(
+                    [np.asarray(idf, dtype=np.float64) for _, idf in guardados]
+                ))
+                with open(os.path.join(temporal, 'campos_vocabularios.json'), 'w', encoding='utf-8') as archivo:
+                    json.dump([terminos for terminos, _ in guardados], archivo, ensure_ascii=False)
+            # Del agrupamiento, como del IVF, bastan centroides y asignación; los términos se guardan ya calculados
+            grupos = estado.modelos.get('grupos')
+            if grupos is not None:
+                np.save(os.path.join(temporal, 'grupos_centroides.npy'), grupos[0])
+                np.save(os.path.join(temporal, 'grupos_asignacion.npy'), grupos[1])
+                with open(os.path.join(temporal, 'grupos_terminos.json'), 'w', encoding='utf-8') as archivo:
+                    json.dump(grupos[4], archivo, ensure_ascii=False)
+            
+            estado.df.to_pickle(os.path.join(temporal, 'filas.pkl'))
+            estado.indice_titulos.guardar(temporal)
+            
+            manifiesto = {
+                'formato': FORMATO_ARTEFACTOS,
+                'csv': self._huella_csv(),
+                'num_vecinos': self.num_vecinos,
+                'motor': self.motor,
+                'dimension_lsa': None if lsa is None else self.motores['lsa'].dimension,
+                'listas_ivf': None if ivf is None else self.motores['ivf'].listas,
+                'campos': None if campos is None else list(MotorCampos.CAMPOS),
+                'num_grupos': None if grupos is None else self.agrupamiento.num_grupos,
+                'num_peliculas': len(estado.df),
+                'forma_tfidf': list(matriz.shape),
+                'version_catalogo': estado.version,
+                'identidad_catalogo': estado.identidad,
+                'creado': time.time()
+            }
+            with open(os.path.join(temporal, 'manifiesto.json'), 'w', encoding='utf-8') as archivo:
+                json.dump(manifiesto, archivo, indent=2)
+            
+            anterior = None
+            if os.path.exists(ruta_artefactos):
+                anterior = f"{ruta_artefactos}.anterior-{os.getpid()}"
+                os.rename(ruta_artefactos, anterior)
+            os.rename(temporal, ruta_artefactos)
+            if anterior is not None:
+                shutil.rmtree(anterior, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(temporal, ignore_errors=True)
+            raise
+    
+    def _cargar_artefactos(self, ruta_artefactos):
+        import pandas as pd
+        
+        ruta_manifiesto = os.path.join(ruta_artefactos, 'manifiesto.json')
+        try:
+            with open(ruta_manifiesto, encoding='utf-8') as archivo:
+                manifiesto = json.load(archivo)
+        except (OSError, ValueError):
+            return None
+        
+        if manifiesto.get('formato') != FORMATO_ARTEFACTOS or manifiesto.get('num_vecinos') != self.num_vecinos:
+            return None
+        if manifiesto.get('motor', 'tfidf') != self.motor:
+            return None
+        if self.motor in ('lsa', 'ivf') and manifiesto.get('dimension_lsa') != self.motores['lsa'].dimension:
+            return None
+        if not self._csv_coincide(manifiesto['csv']):
+            return None
+        
+        def ruta(nombre):
+            return os.path.join(ruta_artefactos, nombre)
+        
+        # Los arreglos grandes se abren con mmap: se leen del disco bajo demanda y se comparten entre procesos
+        matriz_guardada = (
+            np.load(ruta('tfidf_data.npy'), mmap_mode='r'),
+            np.load(ruta('tfidf_indices.npy'), mmap_mode='r'),
+            np.load(ruta('tfidf_indptr.npy'), mmap_mode='r'),
+            tuple(manifiesto['forma_tfidf'])
+        )
+        with open(ruta('vocabulario.json'), encoding='utf-8') as archivo:
+            terminos = json.load(archivo)
+        
+        vecinos = {}
+        if os.path.exists(ruta('matriz_similitud.npy')):
+            vecinos['matriz_similitud'] = np.load(ruta('matriz_similitud.npy'), mmap_mode='r')
+        elif os.path.exists(ruta('vecinos_indices.npy')):
+            vecinos['indices_vecinos'] = np.load(ruta('vecinos_indices.npy'), mmap_mode='r')
+            vecinos['puntuaciones_vecinos'] = np.load(ruta('vecinos_puntuaciones.npy'), mmap_mode='r')
+        modelos = {}
+        if manifiesto.get('dimension_lsa') == self.motores['lsa'].dimension:
+            modelos['lsa'] = (np.load(ruta('lsa_vectores.npy'), mmap_mode='r'), np.load(ruta('lsa_componentes.npy')))
+            # Un índice IVF guardado con otro número de listas se descarta y se vuelve a ajustar
+            if os.path.exists(ruta('ivf_centroides.npy')) and manifiesto.get('listas_ivf') == self.motores['ivf'].listas:
+                modelos['ivf'] = MotorIVF.indice_desde_asignacion(
+                    np.load(ruta('ivf_centroides.npy')), np.load(ruta('ivf_asignacion.npy'))
+                )
+        
+        if manifiesto.get('campos') == list(MotorCampos.CAMPOS):
+            from scipy import sparse
+            
+            limites = np.load(ruta('campos_limites.npy'))
+            idf = np.load(ruta('campos_idf.npy'))
+            with open(ruta('campos_vocabularios.json'), encoding='utf-8') as archivo:
+                vocabularios = json.load(archivo)
+            modelos['campos'] = (
+                sparse.csr_matrix(
+                    (np.load(ruta('campos_data.npy'), mmap_mode='r'),
+                     np.load(ruta('campos_indices.npy'), mmap_mode='r'),
+                     np.load(ruta('campos_indptr.npy'), mmap_mode='r')),
+                    shape=(manifiesto['num_peliculas'], int(limites[-1])),
+                    copy=False
+                ),
+                limites,
+                [(terminos, idf[inicio:fin]) if terminos else None
+                 for terminos, inicio, fin in zip(vocabularios, limites[:-1], limites[1:])]
+            )
+        
+        # Un agrupamiento guardado con otro número de grupos se descarta y se vuelve a calcular
+        if os.path.exists(ruta('grupos_centroides.npy')) and manifiesto.get('num_grupos') == self.agrupamiento.num_grupos:
+            with open(ruta('grupos_terminos.json'), encoding='utf-8') as archivo:
+                terminos_grupos = json.load(archivo)
+            modelos['grupos'] = MotorIVF.indice_desde_asignacion(
+                np.load(ruta('grupos_centroides.npy')), np.load(ruta('grupos_asignacion.npy'))
+            ) + (terminos_grupos,)
+        
+        return EstadoCatalogo(
+            pd.read_pickle(ruta('filas.pkl')),
+            None,
+            IndiceTitulos.cargar(ruta_artefactos, manifiesto['num_peliculas']),
+            vectorizador_guardado=(terminos, np.load(ruta('idf.npy'))),
+            version=manifiesto.get('version_catalogo', 0),
+            identidad=manifiesto.get('identidad_catalogo'),
+            modelos=modelos,
+            matriz_guardada=matriz_guardada,
+            **vecinos
         )
-        self.df['titulo_minusculas'] = self.df['title'].str.lower()
     
-    def _construir_matriz_similitud(self):
-        self.vectorizador = TfidfVectorizer(stop_words='english', max_features=5000)
-        matriz_tfidf = self.vectorizador.fit_transform(self.df['caracteristicas_combinadas'])
-        self.matriz_similitud = cosine_similarity(matriz_tfidf, matriz_tfidf)
+    def _preparar_datos(self, df, primer_id=0):
+        # Cada película recibe un id estable que no cambia al agregar o eliminar otras
+        if 'id' not in df.columns:
+            df.insert(0, 'id', np.arange(primer_id, primer_id + len(df), dtype=np.int64))
+        return df
     
-    def buscar_pelicula(self, titulo_pelicula):
-        titulo_minusculas = titulo_pelicula.lower().strip()
+    def _construir_estado(self, df, version=0, indice_titulos=None, identidad=None):
+        with self.metricas.cronometro('etapa', 'tfidf'):
+            vectorizador = _nuevo_vectorizador()
+            matriz_tfidf = vectorizador.fit_transform(_textos_combinados(df))
+        if indice_titulos is None:
+            with self.metricas.cronometro('etapa', 'indice_titulos'):
+                indice_titulos = IndiceTitulos(df['title'])
+        estado = EstadoCatalogo(
+            df, matriz_tfidf, indice_titulos, vectorizador=vectorizador, version=version, identidad=identidad
+        )
+        with self.metricas.cronometro('etapa', 'estadisticas'):
+            estado.estadisticas
+        if self.agrupamiento.num_grupos is not None:
+            with self.metricas.cronometro('etapa', 'grupos'):
+                self.agrupamiento.modelo(estado)
+        if self.motor in ('lsa', 'ivf'):
+            with self.metricas.cronometro('etapa', 'lsa'):
+                self.motores['lsa'].modelo(estado)
+            if self.motor == 'ivf':
+                with self.metricas.cronometro('etapa', 'ivf'):
+                    self.motores['ivf'].modelo(estado)
+            return estado
+        if self.motor == 'campos':
+            with self.metricas.cronometro('etapa', 'campos'):
+                self.motores['campos'].modelo(estado)
+            return estado
+        with self.metricas.cronometro('etapa', 'similitud'):
+            if self.num_vecinos is None:
+                estado.matriz_similitud = self._similitud_completa(matriz_tfidf)
+            else:
+                estado.indices_vecinos, estado.puntuaciones_vecinos = self._vecinos_completos(
+                    matriz_tfidf, self._k_indice(len(df))
+                )
+        return estado
+    
+    def _en_paralelo(self):
+        return self.procesos is not None and self.procesos > 1
+    
+    def _similitud_completa(self, matriz):
+        if self._en_paralelo():
+            from similitud_paralela import calcular_similitud_paralela
+            return calcular_similitud_paralela(
+                matriz, tamano_bloque=self.tamano_bloque, procesos=self.procesos, progreso=self.progreso
+            )
+        from sklearn.metrics.pairwise import cosine_similarity
+        return cosine_similarity(matriz, matriz)
+    
+    def _vecinos_completos(self, matriz, k):
+        if self._en_paralelo() and k:
+            from similitud_paralela import calcular_similitud_paralela
+            return calcular_similitud_paralela(
+                matriz, k=k, tamano_bloque=self.tamano_bloque, procesos=self.procesos, progreso=self.progreso
+            )
+        return _calcular_vecinos(matriz, np.arange(matriz.shape[0]), k, self.tamano_bloque, self.progreso)
+    
+    def _k_indice(self, total):
+        return max(min(self.num_vecinos, total - 1), 0)
+    
+    @medir_operacion
+    def agregar_peliculas(self, df_nuevas):
+        from scipy import sparse
         
-        coincidencia_exacta = self.df[self.df['titulo_minusculas'] == titulo_minusculas]
-        if not coincidencia_exacta.empty:
-            return coincidencia_exacta.index[0]
+        with self._bloqueo_escritura:
+            estado = self._estado
+            nuevas = _compactar_tipos(df_nuevas.reset_index(drop=True).copy())
+            primer_id = int(estado.df['id'].max()) + 1 if len(estado.df) else 0
+            nuevas = self._preparar_datos(nuevas.drop(columns=['id'], errors='ignore'), primer_id)
+            
+            # Las filas nuevas se vectorizan con el vocabulario y el idf ya ajustados (espacio de características estable)
+            filas = estado.vectorizador.transform(_textos_combinados(nuevas))
+            matriz = sparse.vstack([estado.matriz_tfidf, filas], format='csr')
+            df = _concatenar([estado.df.copy(deep=False), nuevas.reindex(columns=estado.df.columns)])
+            
+            total_anterior = len(estado.df)
+            cambiadas = np.arange(total_anterior, len(df))
+            indice_titulos = estado.indice_titulos.actualizar(
+                titulos=dict(zip(cambiadas.tolist(), nuevas['title'].tolist()))
+            )
+            self._publicar(estado, df, matriz, indice_titulos, cambiadas, agregadas=nuevas)
+            return nuevas['id'].tolist()
+    
+    @medir_operacion
+    def actualizar_pelicula(self, id_pelicula, **campos):
+        import pandas as pd
         
-        coincidencia_parcial = self.df[self.df['titulo_minusculas'].str.contains(titulo_minusculas, na=False)]
-        if not coincidencia_parcial.empty:
-            return coincidencia_parcial.index[0]
+        desconocidos = (set(campos) - set(self.df.columns)) | (set(campos) & {'id'})
+        if desconocidos:
+            raise ValueError(f"Campos no actualizables: {', '.join(sorted(desconocidos))}")
         
-        palabras_clave = titulo_minusculas.split()
-        for palabra in palabras_clave:
-            coincidencia_palabra = self.df[self.df['titulo_minusculas'].str.contains(palabra, na=False)]
-            if not coincidencia_palabra.empty:
-                return coincidencia_palabra.index[0]
+        with self._bloqueo_escritura:
+            estado = self._estado
+            posicion = int(estado.posiciones_de_ids([id_pelicula])[0])
+            if posicion < 0:
+                return False
+            
+            # Como en agregar_peliculas, el estado nuevo comparte con el anterior las columnas que no
+            # cambian: solo se copian las actualizadas
+            df = estado.df.copy(deep=False)
+            cambiadas_df = {}
+            for campo, valor in campos.items():
+                columna = estado.df[campo].copy()
+                if hasattr(columna, 'cat') and pd.notna(valor) and valor not in columna.cat.categories:
+                    columna = columna.cat.add_categories([valor])
+                try:
+                    columna.iat[posicion] = valor
+                except TypeError:
+                    # Valores que la columna compacta no admite ('2001' en un int16): se pasa por object
+                    # y _compactar_tipos la deja como al cargar
+                    columna = columna.astype(object)
+                    columna.iat[posicion] = valor
+                cambiadas_df[campo] = columna
+            # Sin esto un year vacío deja la columna en float64 en vez de Int16
+            for campo, columna in _compactar_tipos(pd.DataFrame(cambiadas_df, copy=False)).items():
+                df[campo] = columna
+            
+            matriz = estado.matriz_tfidf
+            cambiadas = np.empty(0, dtype=np.int64)
+            if set(campos) & set(COLUMNAS_TEXTO):
+                fila = estado.vectorizador.transform(_textos_combinados(df.iloc[[posicion]]))
+                matriz = _reemplazar_fila(matriz, posicion, fila)
+                cambiadas = np.array([posicion])
+            
+            indice_titulos = estado.indice_titulos
+            if 'title' in campos:
+                indice_titulos = indice_titulos.actualizar(titulos={posicion: campos['title']})
+            
+            self._publicar(
+                estado, df, matriz, indice_titulos, cambiadas,
+                eliminadas=estado.df.iloc[[posicion]], agregadas=df.iloc[[posicion]]
+            )
+            return True
+    
+    @medir_operacion
+    def eliminar_pelicula(self, id_pelicula):
+        with self._bloqueo_escritura:
+            estado = self._estado
+            posicion = int(estado.posiciones_de_ids([id_pelicula])[0])
+            if posicion < 0:
+                return False
+            
+            conservar = np.ones(len(estado.df), dtype=bool)
+            conservar[posicion] = False
+            mapa = np.full(len(estado.df), -1, dtype=np.int64)
+            mapa[conservar] = np.arange(conservar.sum())
+            
+            df = estado.df[conservar].reset_index(drop=True)
+            matriz = estado.matriz_tfidf[conservar]
+            indice_titulos = estado.indice_titulos.actualizar(mapa=mapa)
+            self._publicar(
+                estado, df, matriz, indice_titulos, np.empty(0, dtype=np.int64), mapa,
+                eliminadas=estado.df.iloc[[posicion]]
+            )
+            return True
+    
+    @medir_operacion
+    def reconstruir(self):
+        # Reajusta vocabulario e idf sobre el catálogo actual. Las consultas siguen usando la versión
+        # publicada mientras se construye la nueva.
+        with self._bloqueo_escritura:
+            estado = self._estado
+            self._estado = self._construir_estado(estado.df, estado.version + 1, estado.indice_titulos)
+    
+    def _publicar(self, estado, df, matriz, indice_titulos, cambiadas, mapa=None, eliminadas=None, agregadas=None):
+        # `cambiadas` son las posiciones (en el estado nuevo) de filas nuevas o con vector distinto;
+        # `mapa` traduce posiciones antiguas a nuevas cuando se eliminaron filas. `eliminadas` y
+        # `agregadas` son las filas que salen y entran del catálogo (una actualización es ambas cosas)
+        nuevo = EstadoCatalogo(
+            df, matriz, indice_titulos, vectorizador=estado._vectorizador,
+            vectorizador_guardado=estado._vectorizador_guardado, version=estado.version + 1
+        )
+        if estado._estadisticas is not None:
+            nuevo._estadisticas = estado._estadisticas.actualizar(eliminadas, agregadas)
+        if estado.matriz_similitud is not None:
+            nuevo.matriz_similitud = self._parchear_matriz_similitud(estado.matriz_similitud, matriz, cambiadas, mapa)
+        elif estado.indices_vecinos is not None:
+            nuevo.indices_vecinos, nuevo.puntuaciones_vecinos = self._parchear_vecinos(estado, matriz, cambiadas, mapa)
+        for motor in self.motores.values():
+            motor.actualizar(estado, nuevo, cambiadas, mapa)
+        self.agrupamiento.actualizar(estado, nuevo, cambiadas, mapa)
+        self._estado = nuevo
+    
+    def _parchear_matriz_similitud(self, anterior, matriz, cambiadas, mapa):
+        total = matriz.shape[0]
+        similitud = np.zeros((total, total), dtype=anterior.dtype)
+        if mapa is not None:
+            conservadas = np.flatnonzero(mapa >= 0)
+            destino = mapa[conservadas]
+        else:
+            conservadas = destino = np.arange(anterior.shape[0])
+        similitud[np.ix_(destino, destino)] = anterior[np.ix_(conservadas, conservadas)]
         
-        return None
+        if len(cambiadas):
+            filas = (matriz[cambiadas] @ matriz.T).toarray()
+            similitud[cambiadas, :] = filas
+            similitud[:, cambiadas] = filas.T
+        return similitud
+    
+    def _parchear_vecinos(self, estado, matriz, cambiadas, mapa):
+        total = matriz.shape[0]
+        k = self._k_indice(total)
+        if k != estado.indices_vecinos.shape[1]:
+            # El catálogo era más pequeño que num_vecinos: se recalcula todo el índice
+            return self._vecinos_completos(matriz, k)
+        
+        indices = np.asarray(estado.indices_vecinos)
+        puntuaciones = np.array(estado.puntuaciones_vecinos)
+        if mapa is not None:
+            conservadas = mapa >= 0
+            indices = mapa[indices[conservadas]]
+            puntuaciones = puntuaciones[conservadas]
+        else:
+            total_anterior = indices.shape[0]
+            indices = np.vstack([indices, np.zeros((total - total_anterior, k), dtype=indices.dtype)])
+            puntuaciones = np.vstack([puntuaciones, np.zeros((total - total_anterior, k), dtype=puntuaciones.dtype)])
+        indices = indices.astype(np.int32)
+        
+        # Se recalculan por completo las filas cambiadas y las que tenían como vecina una fila
+        # eliminada (-1 tras el mapa) o modificada; el resto solo incorpora a las cambiadas si entran en su top-k
+        recalcular = np.isin(indices, cambiadas).any(axis=1) | (indices < 0).any(axis=1)
+        recalcular[cambiadas] = True
+        filas_recalcular = np.flatnonzero(recalcular)
+        indices[filas_recalcular], puntuaciones[filas_recalcular] = _calcular_vecinos(
+            matriz, filas_recalcular, k, self.tamano_bloque
+        )
+        
+        if len(cambiadas) and k:
+            traspuesta = matriz.T.tocsr()
+            for inicio in range(0, len(cambiadas), self.tamano_bloque):
+                bloque_filas = cambiadas[inicio:inicio + self.tamano_bloque]
+                bloque = (matriz[bloque_filas] @ traspuesta).toarray()
+                bloque[:, recalcular] = -np.inf
+                afectadas = np.flatnonzero(bloque.max(axis=0) > puntuaciones[:, -1])
+                if afectadas.size == 0:
+                    continue
+                candidatos_indices = np.concatenate(
+                    [indices[afectadas], np.broadcast_to(bloque_filas.astype(np.int32), (len(afectadas), len(bloque_filas)))], axis=1
+                )
+                candidatos_puntuaciones = np.concatenate([puntuaciones[afectadas], bloque[:, afectadas].T], axis=1)
+                seleccion, puntuaciones[afectadas] = _seleccionar_top_k(candidatos_puntuaciones, k)
+                indices[afectadas] = np.take_along_axis(candidatos_indices, seleccion, axis=1)
+        return indices, puntuaciones
     
-    def recomendar_peliculas(self, titulo_pelicula, num_recomendaciones=5):
-        indice_pelicula = self.buscar_pelicula(titulo_pelicula)
+    def _motor(self, nombre=None, pesos=None):
+        # Con `pesos` la consulta usa las matrices por campo combinadas con esos pesos
+        if pesos is not None:
+            if nombre not in (None, 'campos'):
+                raise ValueError(f"Los pesos por campo no se aplican al motor '{nombre}'")
+            return self.motores['campos'].con_pesos(pesos)
+        nombre = self.motor if nombre is None else nombre
+        if nombre not in self.motores:
+            raise ValueError(f"Motor desconocido: {nombre}")
+        return self.motores[nombre]
+    
+    def _filas_con_puntuacion(self, estado, indices, puntuaciones):
+        filas = _filas_a_dicts(estado.df.iloc[indices])
+        for fila, puntuacion in zip(filas, np.round(np.asarray(puntuaciones, dtype=np.float64) * 100, 2).tolist()):
+            fila['puntuacion_similitud'] = puntuacion
+        return filas
+    
+    def _buscar(self, estado, titulo_pelicula):
+        candidatos = estado.indice_titulos.buscar(titulo_pelicula, limite=1)
+        if not candidatos:
+            self.metricas.contar('coincidencias_titulo', 'sin_coincidencia')
+            return None
+        self.metricas.contar('coincidencias_titulo', candidatos[0][2])
+        return candidatos[0][0]
+    
+    @medir_operacion
+    @cachear
+    def buscar_pelicula(self, titulo_pelicula):
+        return self._buscar(self._estado, titulo_pelicula)
+    
+    @medir_operacion
+    @cachear
+    def buscar_candidatos(self, titulo_pelicula, limite=5):
+        estado = self._estado
+        candidatos = estado.indice_titulos.buscar(titulo_pelicula, limite=limite)
+        filas = _filas_a_dicts(estado.df.iloc[[indice for indice, _, _ in candidatos]])
+        for fila, (_, puntuacion, tipo) in zip(filas, candidatos):
+            fila['puntuacion_titulo'] = round(float(puntuacion), 3)
+            fila['tipo_coincidencia'] = tipo
+        return filas
+    
+    @medir_operacion
+    @cachear
+    def recomendar_peliculas(self, titulo_pelicula, num_recomendaciones=5, genero=None, anios=None,
+                             rating_minimo=None, pais=None, excluir_ids=None, motor=None, pesos=None,
+                             grupos_cercanos=None):
+        # `motor` ('tfidf', 'lsa', 'ivf' o 'campos') elige el motor de similitud de esta consulta; por defecto,
+        # el del recomendador. `pesos={'genre': .., 'director': .., 'cast': .., 'description': ..}` combina
+        # las similitudes por campo con esos pesos (los campos que faltan pesan 1) sin reajustar el modelo.
+        # Con `grupos_cercanos=g` solo se buscan candidatos en el grupo de la película y los g - 1 más cercanos.
+        estado = self._estado
+        motor = self._motor(motor, pesos)
+        indice_pelicula = self._buscar(estado, titulo_pelicula)
         
         if indice_pelicula is None:
             return None, None
         
-        pelicula = self.df.iloc[indice_pelicula]
+        pelicula = _filas_a_dicts(estado.df.iloc[[indice_pelicula]])[0]
         
-        puntuaciones_similitud = list(enumerate(self.matriz_similitud[indice_pelicula]))
-        puntuaciones_similitud = sorted(puntuaciones_similitud, key=lambda x: x[1], reverse=True)
+        sin_facetas = genero is None and anios is None and rating_minimo is None and pais is None
+        if sin_facetas and not excluir_ids and not grupos_cercanos:
+            indices, puntuaciones = motor.vecinos(estado, [indice_pelicula], num_recomendaciones)
+            indices, puntuaciones = indices[0], puntuaciones[0]
+        else:
+            if grupos_cercanos:
+                grupos = self.agrupamiento.modelo(estado)
+                cercanas = self.agrupamiento.miembros(grupos, self.agrupamiento.cercanos(
+                    grupos, estado.matriz_tfidf, indice_pelicula, grupos_cercanos
+                ))
+            if sin_facetas and grupos_cercanos:
+                candidatos = cercanas
+            else:
+                candidatos = estado.facetas.filtrar(
+                    genero=genero, anios=anios, pais=pais,
+                    rating=None if rating_minimo is None else (rating_minimo, None)
+                )
+                if grupos_cercanos:
+                    candidatos = np.intersect1d(candidatos, cercanas, assume_unique=True)
+            if excluir_ids:
+                excluidos = estado.posiciones_de_ids(list(excluir_ids))
+                candidatos = candidatos[~np.isin(candidatos, excluidos[excluidos >= 0])]
+            indices, puntuaciones = motor.vecinos_filtrados(estado, indice_pelicula, num_recomendaciones, candidatos)
+        recomendaciones = self._filas_con_puntuacion(estado, indices, puntuaciones)
         
-        peliculas_top = puntuaciones_similitud[1:num_recomendaciones + 1]
+        return pelicula, recomendaciones
+    
+    def _vecinos_lote(self, estado, indices_semillas, k, motor=None):
+        # Puntúa las semillas en bloques de tamano_bloque filas: un producto por bloque
+        motor = self._motor(motor)
+        bloques_indices = []
+        bloques_puntuaciones = []
+        for inicio in range(0, len(indices_semillas), self.tamano_bloque):
+            indices, puntuaciones = motor.vecinos(estado, indices_semillas[inicio:inicio + self.tamano_bloque], k)
+            bloques_indices.append(indices)
+            bloques_puntuaciones.append(puntuaciones)
+        if not bloques_indices:
+            return np.empty((0, 0), dtype=np.int32), np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(bloques_indices), np.concatenate(bloques_puntuaciones)
+    
+    @medir_operacion
+    def recomendar_lote(self, titulos, k=5):
+        import pandas as pd
         
-        recomendaciones = []
-        for indice, puntuacion in peliculas_top:
-            pelicula_rec = self.df.iloc[indice].to_dict()
-            pelicula_rec['puntuacion_similitud'] = round(puntuacion * 100, 2)
-            recomendaciones.append(pelicula_rec)
+        estado = self._estado
+        semillas = [(titulo, self._buscar(estado, titulo)) for titulo in titulos]
+        semillas = [(titulo, indice) for titulo, indice in semillas if indice is not None]
         
-        return pelicula.to_dict(), recomendaciones
+        indices_semillas = np.array([indice for _, indice in semillas], dtype=np.int64)
+        indices, puntuaciones = self._vecinos_lote(estado, indices_semillas, k)
+        
+        k = indices.shape[1]
+        indices = indices.ravel()
+        puntuaciones = puntuaciones.ravel()
+        titulos_df = estado.df['title'].to_numpy()
+        
+        return pd.DataFrame({
+            'consulta': np.repeat([titulo for titulo, _ in semillas], k),
+            'titulo_semilla': np.repeat(titulos_df[indices_semillas], k),
+            'posicion': np.tile(np.arange(1, k + 1), len(semillas)),
+            'indice': indices,
+            'title': titulos_df[indices],
+            'puntuacion_similitud': np.round(puntuaciones.astype(np.float64) * 100, 2)
+        })
     
+    @medir_operacion
+    def recomendar_varias(self, titulos, num_recomendaciones=5):
+        # Igual que llamar a recomendar_peliculas con cada título, pero con un solo producto por bloque
+        # y una sola lectura de filas del DataFrame; devuelve (pelicula, recomendaciones) por título,
+        # o (None, None) si no se encontró. Comparte las entradas de caché con recomendar_peliculas.
+        if self.cache is None:
+            return self._recomendar_varias(titulos, num_recomendaciones)
+        resultados = [None] * len(titulos)
+        pendientes = []
+        for posicion, titulo in enumerate(titulos):
+            clave = clave_consulta(
+                RecomendadorPeliculas.recomendar_peliculas, self, (titulo, num_recomendaciones), {}
+            )
+            encontrado, resultados[posicion] = self.cache.obtener(clave)
+            if not encontrado:
+                pendientes.append((posicion, clave))
+        calculados = self._recomendar_varias([titulos[posicion] for posicion, _ in pendientes], num_recomendaciones)
+        for (posicion, clave), resultado in zip(pendientes, calculados):
+            self.cache.guardar(clave, resultado)
+            resultados[posicion] = resultado
+        return resultados
+    
+    def _recomendar_varias(self, titulos, num_recomendaciones):
+        estado = self._estado
+        indices_semillas = [self._buscar(estado, titulo) for titulo in titulos]
+        encontrados = np.array([indice for indice in indices_semillas if indice is not None], dtype=np.int64)
+        indices, puntuaciones = self._vecinos_lote(estado, encontrados, num_recomendaciones)
+        
+        k = indices.shape[1] if indices.ndim == 2 else 0
+        filas = _filas_a_dicts(estado.df.iloc[np.concatenate((encontrados, indices.ravel()))])
+        peliculas, vecinos = filas[:len(encontrados)], filas[len(encontrados):]
+        for fila, puntuacion in zip(vecinos, np.round(puntuaciones.ravel().astype(np.float64) * 100, 2).tolist()):
+            fila['puntuacion_similitud'] = puntuacion
+        
+        resultados = []
+        posicion = 0
+        for indice in indices_semillas:
+            if indice is None:
+                resultados.append((None, None))
+                continue
+            resultados.append((peliculas[posicion], vecinos[posicion * k:(posicion + 1) * k]))
+            posicion += 1
+        return resultados
+    
+    @medir_operacion
+    def recomendar_para_perfil(self, titulos, pesos=None, num_recomendaciones=5, vida_media=None, motor=None,
+                               pesos_campos=None):
+        # Recomendaciones para un historial: las filas de las películas vistas se combinan en un solo
+        # vector de perfil (centroide ponderado) y el catálogo se puntúa con un único producto, así que
+        # el coste apenas depende del largo del historial. `pesos` da un peso a cada título (por defecto 1);
+        # con `vida_media` el peso se reduce a la mitad cada `vida_media` títulos hacia atrás (los títulos
+        # van del más antiguo al más reciente). Las películas del historial no se recomiendan.
+        # Devuelve (peliculas_del_historial, recomendaciones), o (None, None) si no se encontró ninguna.
+        estado = self._estado
+        motor = self._motor(motor, pesos_campos)
+        pesos = np.ones(len(titulos)) if pesos is None else np.asarray(pesos, dtype=np.float64)
+        if len(pesos) != len(titulos):
+            raise ValueError("Se necesita un peso por título")
+        if not np.isfinite(pesos).all() or (pesos < 0).any():
+            raise ValueError("Los pesos deben ser números no negativos")
+        if vida_media is not None:
+            if vida_media <= 0:
+                raise ValueError("vida_media debe ser positiva")
+            pesos = pesos * 0.5 ** (np.arange(len(titulos))[::-1] / vida_media)
+        
+        indices_semillas = [self._buscar(estado, titulo) for titulo in titulos]
+        encontrados = [posicion for posicion, indice in enumerate(indices_semillas) if indice is not None]
+        if not encontrados:
+            return None, None
+        # Con todos los pesos en cero el perfil sería el vector nulo y cualquier orden valdría lo mismo
+        if pesos[encontrados].sum() <= 0:
+            raise ValueError("Los pesos de los títulos encontrados no pueden ser todos cero")
+        semillas = np.array([indices_semillas[posicion] for posicion in encontrados], dtype=np.int64)
+        indices, puntuaciones = motor.vecinos_perfil(estado, semillas, pesos[encontrados], num_recomendaciones)
+        
+        peliculas = _filas_a_dicts(estado.df.iloc[list(dict.fromkeys(semillas.tolist()))])
+        return peliculas, self._filas_con_puntuacion(estado, indices, puntuaciones)
+    
+    @medir_operacion
     def obtener_estadisticas(self):
-        estadisticas = {
-            'total_peliculas': len(self.df),
-            'rating_promedio': round(self.df['rating'].mean(), 2),
-            'rating_maximo': self.df['rating'].max(),
-            'rating_minimo': self.df['rating'].min(),
-            'rango_anios': f"{self.df['year'].min()} - {self.df['year'].max()}",
-            'top_generos': self.df['genre'].str.split('/').explode().value_counts().head(5).to_dict(),
-            'top_directores': self.df['director'].value_counts().head(5).to_dict(),
-            'top_paises': self.df['country'].value_counts().head(5).to_dict()
-        }
-        return estadisticas
+        # Se leen de las estadísticas materializadas: el coste no depende del tamaño del catálogo.
+        # Incluye el histograma de ratings ({'bordes', 'conteos'}) y las películas por año
+        return dict(self._estado.estadisticas.resumen())
     
+    @medir_operacion
+    def filtrar(self, genero=None, director=None, anios=None, rating=None, pais=None, ordenar_por=None):
+        # anios y rating son tuplas (mínimo, máximo) inclusivas; cualquiera de los extremos puede ser None.
+        # No pasa por la caché: devuelve todas las filas y serializarlas costaría más que volver a filtrar
+        # (filtrar_pagina sí se guarda)
+        estado = self._estado
+        posiciones = estado.facetas.filtrar(
+            genero=genero, director=director, anios=anios, rating=rating, pais=pais, ordenar_por=ordenar_por
+        )
+        return estado.df.iloc[posiciones]
+    
+    @medir_operacion
+    @cachear
+    def filtrar_pagina(self, genero=None, director=None, anios=None, rating=None, pais=None,
+                       ordenar_por=None, descendente=None, pagina=0, tamano_pagina=50):
+        # Como filtrar, pero solo materializa las filas de la página pedida (desde 0).
+        # ordenar_por admite 'rating', 'year' o 'title'; sin `descendente` el rating y el año
+        # van de mayor a menor y el título en orden alfabético. Devuelve (total, df_pagina).
+        estado = self._estado
+        facetas = estado.facetas
+        candidatos = facetas.filtrar(genero=genero, director=director, anios=anios, rating=rating, pais=pais)
+        if descendente is None:
+            descendente = ordenar_por in ('rating', 'year')
+        inicio = max(pagina, 0) * tamano_pagina
+        posiciones = facetas.pagina(candidatos, ordenar_por, descendente, inicio, inicio + tamano_pagina)
+        return len(candidatos), estado.df.iloc[posiciones]
+    
+    @medir_operacion
     def obtener_peliculas_por_genero(self, genero):
-        return self.df[self.df['genre'].str.contains(genero, case=False, na=False)]
+        return self.filtrar(genero=genero)
     
+    @medir_operacion
     def obtener_peliculas_por_director(self, director):
-        return self.df[self.df['director'].str.contains(director, case=False, na=False)]
+        return self.filtrar(director=director)
+    
+    @medir_operacion
+    def listar_generos(self):
+        return self._estado.facetas.listar_generos()
     
-    def comparar_peliculas(self, titulo_pelicula1, titulo_pelicula2):
-        indice1 = self.buscar_pelicula(titulo_pelicula1)
-        indice2 = self.buscar_pelicula(titulo_pelicula2)
+    @medir_operacion
+    def listar_directores(self):
+        return self._estado.facetas.listar_directores()
+    
+    @medir_operacion
+    def listar_paises(self):
+        return self._estado.facetas.listar_paises()
+    
+    @medir_operacion
+    def limites_facetas(self):
+        facetas = self._estado.facetas
+        anio_min, anio_max = facetas.anios.limites()
+        rating_min, rating_max = facetas.ratings.limites()
+        return {
+            'anios': (None if anio_min is None else int(anio_min), None if anio_max is None else int(anio_max)),
+            'rating': (None if rating_min is None else round(rating_min, 4), None if rating_max is None else round(rating_max, 4))
+        }
+    
+    @medir_operacion
+    @cachear
+    def comparar_peliculas(self, titulo_pelicula1, titulo_pelicula2, motor=None, pesos=None):
+        estado = self._estado
+        motor = self._motor(motor, pesos)
+        indice1 = self._buscar(estado, titulo_pelicula1)
+        indice2 = self._buscar(estado, titulo_pelicula2)
         
         if indice1 is None or indice2 is None:
             return None, None
         
-        pelicula1 = self.df.iloc[indice1].to_dict()
-        pelicula2 = self.df.iloc[indice2].to_dict()
+        pelicula1, pelicula2 = _filas_a_dicts(estado.df.iloc[[indice1, indice2]])
         
-        similitud = self.matriz_similitud[indice1][indice2]
+        similitud = motor.similitud(estado, indice1, indice2)
         
+        # Sin rating o año en alguna de las dos, la diferencia queda en None como en comparar_multiples
+        ratings = (pelicula1['rating'], pelicula2['rating'])
+        anios = (pelicula1['year'], pelicula2['year'])
         comparacion = {
             'similitud': round(similitud * 100, 2),
-            'diferencia_rating': round(abs(pelicula1['rating'] - pelicula2['rating']), 2),
-            'diferencia_anios': abs(pelicula1['year'] - pelicula2['year'])
+            'diferencia_rating': None if None in ratings else round(abs(ratings[0] - ratings[1]), 2),
+            'diferencia_anios': None if None in anios else abs(anios[0] - anios[1])
         }
         
         return pelicula1, pelicula2, comparacion
+    
+    @medir_operacion
+    @cachear
+    def comparar_multiples(self, titulos, motor=None, pesos=None):
+        # Compara todos los pares de una lista de títulos con un solo producto. Devuelve las películas
+        # encontradas (sin repetir, en el orden pedido), los títulos no encontrados y las matrices de
+        # similitud (en %), diferencia de rating y diferencia de años: la celda [i][j] compara las
+        # películas i y j de 'peliculas'
+        estado = self._estado
+        motor = self._motor(motor, pesos)
+        indices = {}
+        no_encontrados = []
+        for titulo in titulos:
+            indice = self._buscar(estado, titulo)
+            if indice is None:
+                no_encontrados.append(titulo)
+            else:
+                indices.setdefault(indice, titulo)
+        indices = np.array(list(indices), dtype=np.int64)
+        
+        filas = estado.df.iloc[indices]
+        similitud = motor.similitud_matriz(estado, indices) if len(indices) else np.empty((0, 0))
+        ratings = np.round(filas['rating'].to_numpy(dtype=np.float64, na_value=np.nan), 4)
+        anios = filas['year'].to_numpy(dtype=np.float64, na_value=np.nan)
+        
+        return {
+            'peliculas': _filas_a_dicts(filas),
+            'no_encontrados': no_encontrados,
+            'similitud': _matriz_a_listas(np.round(similitud * 100, 2)),
+            'diferencia_rating': _matriz_a_listas(np.round(np.abs(ratings[:, np.newaxis] - ratings), 2)),
+            'diferencia_anios': _matriz_a_listas(np.abs(anios[:, np.newaxis] - anios), int),
+        }
+    
+    def _describir_grupos(self, estado, grupos, seleccion, ejemplos=3):
+        # Tamaño, términos principales y las películas de mayor rating de cada grupo de `seleccion`
+        _, _, orden, inicios, terminos = grupos
+        titulos = estado.df['title']
+        descripciones = []
+        for grupo in seleccion:
+            miembros = orden[inicios[grupo]:inicios[grupo + 1]]
+            destacadas = estado.facetas.pagina(miembros, 'rating', True, 0, ejemplos)
+            descripciones.append({
+                'grupo': int(grupo),
+                'tamano': len(miembros),
+                'terminos': list(terminos[grupo]),
+                'ejemplos': titulos.iloc[destacadas].tolist(),
+            })
+        return descripciones
+    
+    def _grupo_valido(self, grupos, grupo):
+        grupo = int(grupo)
+        if not 0 <= grupo < len(grupos[0]):
+            raise ValueError(f"Grupo desconocido: {grupo}")
+        return grupo
+    
+    @medir_operacion
+    def contar_grupos(self):
+        # Número de grupos del agrupamiento, incluidos los vacíos: los ids válidos van de 0 a contar_grupos() - 1
+        return len(self.agrupamiento.modelo(self._estado)[0])
+    
+    @medir_operacion
+    @cachear
+    def listar_grupos(self, ejemplos=3):
+        # Los grupos no vacíos del agrupamiento del catálogo, para explorarlo por temas
+        estado = self._estado
+        grupos = self.agrupamiento.modelo(estado)
+        return self._describir_grupos(estado, grupos, np.flatnonzero(np.diff(grupos[3])), ejemplos)
+    
+    @medir_operacion
+    @cachear
+    def grupos_de_pelicula(self, titulo_pelicula, cantidad=3):
+        # El grupo de la película y los siguientes más cercanos a su vector; devuelve (pelicula, grupos)
+        estado = self._estado
+        indice_pelicula = self._buscar(estado, titulo_pelicula)
+        if indice_pelicula is None:
+            return None, None
+        grupos = self.agrupamiento.modelo(estado)
+        seleccion = self.agrupamiento.cercanos(grupos, estado.matriz_tfidf, indice_pelicula, cantidad)
+        return _filas_a_dicts(estado.df.iloc[[indice_pelicula]])[0], self._describir_grupos(estado, grupos, seleccion)
+    
+    @medir_operacion
+    @cachear
+    def grupos_similares(self, grupo, cantidad=5):
+        # Los grupos más parecidos a `grupo` (coseno entre centroides, en %)
+        estado = self._estado
+        grupos = self.agrupamiento.modelo(estado)
+        seleccion, cosenos = self.agrupamiento.similares(grupos, self._grupo_valido(grupos, grupo), cantidad)
+        descripciones = self._describir_grupos(estado, grupos, seleccion)
+        for descripcion, coseno in zip(descripciones, np.round(cosenos.astype(np.float64) * 100, 2).tolist()):
+            descripcion['similitud'] = coseno
+        return descripciones
+    
+    @medir_operacion
+    @cachear
+    def peliculas_del_grupo(self, grupo, pagina=0, tamano_pagina=50):
+        # Películas del grupo de mayor a menor rating, por páginas como filtrar_pagina; devuelve (total, df_pagina)
+        estado = self._estado
+        grupos = self.agrupamiento.modelo(estado)
+        miembros = self.agrupamiento.miembros(grupos, [self._grupo_valido(grupos, grupo)])
+        inicio = max(pagina, 0) * tamano_pagina
+        posiciones = estado.facetas.pagina(miembros, 'rating', True, inicio, inicio + tamano_pagina)
+        return len(miembros), estado.df.iloc[posiciones]
+    
+    @medir_operacion
+    def evaluar_motor(self, motor='lsa', k=10, muestras=200, semilla=0, referencia='tfidf'):
+        # Compara el top-k de `motor` con el de `referencia` sobre una muestra de películas:
+        # recall@k (fracción de los k vecinos de referencia que también devuelve el motor), memoria y tiempo.
+        # Con motor='ivf' y referencia='lsa' se mide solo el error de la búsqueda aproximada.
+        estado = self._estado
+        total = len(estado.df)
+        filas = np.random.default_rng(semilla).choice(total, size=min(muestras, total), replace=False)
+        
+        resultados = {}
+        for nombre in (referencia, motor):
+            # La primera llamada ajusta el modelo si hace falta; no cuenta en el tiempo por consulta
+            self._motor(nombre).memoria_bytes(estado)
+            inicio = time.perf_counter()
+            indices, _ = self._vecinos_lote(estado, filas, k, nombre)
+            resultados[nombre] = (indices, (time.perf_counter() - inicio) / max(len(filas), 1))
+        
+        exactos, aproximados = resultados[referencia][0], resultados[motor][0]
+        aciertos = sum(len(np.intersect1d(fila_exacta, fila)) for fila_exacta, fila in zip(exactos, aproximados))
+        return {
+            'motor': motor,
+            'referencia': referencia,
+            'k': int(exactos.shape[1]) if exactos.ndim == 2 else 0,
+            'muestras': len(filas),
+            'recall_a_k': round(aciertos / exactos.size, 4) if exactos.size else 1.0,
+            'memoria_bytes': {nombre: self._motor(nombre).memoria_bytes(estado) for nombre in (referencia, motor)},
+            'ms_por_consulta': {nombre: round(segundos * 1000, 4) for nombre, (_, segundos) in resultados.items()},
+        }
@@ -0,0 +1,622 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+MENSAJES_HTTP = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error'
+}
+MAX_CUERPO = 1 << 20
+# Títulos por petición a /comparar_multiples: la respuesta crece con el cuadrado
+MAX_COMPARAR = 200
+# Órdenes que admite /filtrar (los de filtrar_pagina)
+ORDENES_FILTRO = ('rating', 'year', 'title')
+
+
+class ErrorPeticion(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _a_json(valor):
+    # Los valores de numpy/pandas que quedan en las filas se convierten a tipos de Python; los datos
+    # que faltan (NaN, pd.NA) van como null, porque las respuestas no admiten NaN
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+        return None if valor != valor else valor
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    if isinstance(valor, tuple):
+        return list(valor)
+    import pandas as pd
+
+    if valor is pd.NA:
+        return None
+    raise TypeError(f"{type(valor).__name__} no es serializable")
+
+
+def _entero(parametros, nombre, defecto=None, minimo=1, maximo=100):
+    valor = parametros.get(nombre)
+    if valor is None or valor == '':
+        return defecto
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        raise ErrorPeticion(400, f"'{nombre}' debe ser un entero")
+    if not minimo <= valor <= maximo:
+        raise ErrorPeticion(400, f"'{nombre}' debe estar entre {minimo} y {maximo}")
+    return valor
+
+
+def _rango(parametros, nombre, tipo):
+    # Acepta [min, max] en JSON o "min,max" en la query; cualquiera de los extremos puede faltar
+    valor = parametros.get(nombre)
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, str):
+        valor = valor.split(',')
+    if not isinstance(valor, (list, tuple)) or len(valor) != 2:
+        raise ErrorPeticion(400, f"'{nombre}' debe tener la forma [minimo, maximo]")
+    try:
+        return tuple(None if extremo in (None, '') else tipo(extremo) for extremo in valor)
+    except (TypeError, ValueError):
+        raise ErrorPeticion(400, f"'{nombre}' contiene valores no numéricos")
+
+
+def _pesos(parametros):
+    # Acepta {"director": 2, ...} en JSON o "director:2,cast:0.5" en la query
+    valor = parametros.get('pesos')
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, str):
+        try:
+            valor = dict(parte.split(':', 1) for parte in valor.split(',') if parte.strip())
+        except ValueError:
+            raise ErrorPeticion(400, "'pesos' debe tener la forma campo:peso,campo:peso")
+    if not isinstance(valor, dict):
+        raise ErrorPeticion(400, "'pesos' debe ser un objeto {campo: peso}")
+    try:
+        return {campo.strip(): float(peso) for campo, peso in valor.items()}
+    except (TypeError, ValueError):
+        raise ErrorPeticion(400, "'pesos' contiene valores no numéricos")
+
+
+def _titulos(parametros):
+    # Acepta ["a", "b"] en JSON o "a|b" en la query
+    titulos = parametros.get('titulos')
+    if isinstance(titulos, str):
+        titulos = [titulo for titulo in titulos.split('|') if titulo.strip()]
+    if not isinstance(titulos, list) or not titulos or not all(isinstance(titulo, str) for titulo in titulos):
+        raise ErrorPeticion(400, "'titulos' debe ser una lista de títulos")
+    return titulos
+
+
+def _ids(parametros, nombre):
+    # Acepta [1, 2] en JSON o "1,2" en la query
+    valor = parametros.get(nombre)
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, str):
+        valor = [parte for parte in valor.split(',') if parte.strip()]
+    if not isinstance(valor, list) or any(isinstance(id_pelicula, (bool, float)) for id_pelicula in valor):
+        raise ErrorPeticion(400, f"'{nombre}' debe ser una lista de ids enteros")
+    try:
+        return [int(id_pelicula) for id_pelicula in valor]
+    except (TypeError, ValueError):
+        raise ErrorPeticion(400, f"'{nombre}' debe ser una lista de ids enteros")
+
+
+def _texto(parametros, nombre):
+    valor = parametros.get(nombre)
+    if valor is None or valor == '':
+        return None
+    if not isinstance(valor, str):
+        raise ErrorPeticion(400, f"'{nombre}' debe ser un texto")
+    return valor
+
+
+def _booleano(parametros, nombre):
+    # Acepta true/false en JSON o "true"/"false" (también 1/0) en la query
+    valor = parametros.get(nombre)
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, bool):
+        return valor
+    if isinstance(valor, str) and valor.lower() in ('true', '1', 'false', '0'):
+        return valor.lower() in ('true', '1')
+    raise ErrorPeticion(400, f"'{nombre}' debe ser true o false")
+
+
+def _obligatorio(parametros, nombre):
+    valor = parametros.get(nombre)
+    if not isinstance(valor, str) or not valor.strip():
+        raise ErrorPeticion(400, f"falta el parámetro '{nombre}'")
+    return valor
+
+
+class Latencias:
+    # Ventana de las últimas mediciones por endpoint para informar percentiles sin crecer sin límite
+
+    def __init__(self, tamano_ventana=10000):
+        self.tamano_ventana = tamano_ventana
+        self.ventanas = {}
+        self.totales = {}
+
+    def registrar(self, endpoint, segundos):
+        self.ventanas.setdefault(endpoint, deque(maxlen=self.tamano_ventana)).append(segundos)
+        self.totales[endpoint] = self.totales.get(endpoint, 0) + 1
+
+    def resumen(self):
+        resumen = {}
+        for endpoint, ventana in self.ventanas.items():
+            milisegundos = np.fromiter(ventana, dtype=np.float64) * 1000
+            p50, p99 = np.percentile(milisegundos, [50, 99])
+            resumen[endpoint] = {
+                'peticiones': self.totales[endpoint],
+                'p50_ms': round(float(p50), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(milisegundos.max()), 3)
+            }
+        return resumen
+
+
+class AgrupadorRecomendaciones:
+    # Junta las peticiones de recomendación que llegan casi a la vez y las resuelve con una sola
+    # llamada a recomendar_varias (un producto disperso por bloque) en el hilo del modelo
+
+    def __init__(self, recomendador, ejecutor, max_lote=64, espera_maxima=0.002):
+        self.recomendador = recomendador
+        self.ejecutor = ejecutor
+        self.max_lote = max_lote
+        self.espera_maxima = espera_maxima
+        self.pendientes = []
+        self.temporizador = None
+        self.lotes = 0
+        self.peticiones = 0
+        self.tamano_maximo = 0
+
+    def recomendar(self, titulo, num_recomendaciones):
+        bucle = asyncio.get_running_loop()
+        futuro = bucle.create_future()
+        self.pendientes.append((titulo, num_recomendaciones, futuro))
+        if len(self.pendientes) >= self.max_lote:
+            self._despachar()
+        elif self.temporizador is None:
+            self.temporizador = bucle.call_later(self.espera_maxima, self._despachar)
+        return futuro
+
+    def _despachar(self):
+        if self.temporizador is not None:
+            self.temporizador.cancel()
+            self.temporizador = None
+        lote, self.pendientes = self.pendientes, []
+        if lote:
+            asyncio.ensure_future(self._resolver(lote))
+
+    async def _resolver(self, lote):
+        self.lotes += 1
+        self.peticiones += len(lote)
+        self.tamano_maximo = max(self.tamano_maximo, len(lote))
+        # Se pide el mayor k del lote; el top-k viene ordenado, así que cada petición toma su prefijo
+        k = max(num_recomendaciones for _, num_recomendaciones, _ in lote)
+        titulos = [titulo for titulo, _, _ in lote]
+        try:
+            resultados = await asyncio.get_running_loop().run_in_executor(
+                self.ejecutor, self.recomendador.recomendar_varias, titulos, k
+            )
+        except Exception as error:
+            for _, _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(error)
+            return
+        for (_, num_recomendaciones, futuro), (pelicula, recomendaciones) in zip(lote, resultados):
+            if not futuro.done():
+                futuro.set_result((pelicula, None if recomendaciones is None else recomendaciones[:num_recomendaciones]))
+
+    def resumen(self):
+        return {
+            'lotes': self.lotes,
+            'peticiones': self.peticiones,
+            'tamano_medio': round(self.peticiones / self.lotes, 2) if self.lotes else 0.0,
+            'tamano_maximo': self.tamano_maximo,
+            'max_lote': self.max_lote,
+            'espera_maxima_ms': self.espera_maxima * 1000
+        }
+
+
+class ServicioRecomendaciones:
+    def __init__(self, recomendador, max_lote=64, espera_maxima=0.002):
+        self.recomendador = recomendador
+        # El modelo se consulta desde un único hilo: el bucle de eventos queda libre para aceptar
+        # peticiones y los lotes no compiten entre sí por el GIL
+        self.ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='modelo')
+        self.agrupador = AgrupadorRecomendaciones(recomendador, self.ejecutor, max_lote, espera_maxima)
+        self.latencias = Latencias()
+        self.inicio = time.time()
+        self.rutas = {
+            '/recomendar': self._recomendar,
+            '/perfil': self._perfil,
+            '/buscar': self._buscar,
+            '/comparar': self._comparar,
+            '/comparar_multiples': self._comparar_multiples,
+            '/grupos': self._grupos,
+            '/filtrar': self._filtrar,
+            '/estadisticas': self._estadisticas,
+            '/metricas': self._metricas,
+        }
+
+    def _en_modelo(self, funcion, *argumentos, **opciones):
+        return asyncio.get_running_loop().run_in_executor(self.ejecutor, lambda: funcion(*argumentos, **opciones))
+
+    async def _recomendar(self, parametros):
+        titulo = _obligatorio(parametros, 'titulo')
+        num_recomendaciones = _entero(parametros, 'k', defecto=5)
+        filtros = {
+            'genero': _texto(parametros, 'genero'),
+            'anios': _rango(parametros, 'anios', int),
+            'pais': _texto(parametros, 'pais'),
+        }
+        rating_minimo = parametros.get('rating_minimo')
+        if rating_minimo not in (None, ''):
+            try:
+                filtros['rating_minimo'] = float(rating_minimo)
+            except (TypeError, ValueError):
+                raise ErrorPeticion(400, "'rating_minimo' debe ser un número")
+        excluir_ids = _ids(parametros, 'excluir_ids')
+        if excluir_ids:
+            filtros['excluir_ids'] = excluir_ids
+        filtros['pesos'] = _pesos(parametros)
+        filtros['grupos_cercanos'] = _entero(parametros, 'grupos_cercanos', maximo=sys.maxsize)
+
+        filtros = {nombre: valor for nombre, valor in filtros.items() if valor is not None}
+        if filtros:
+            # Con filtros o pesos cada consulta tiene sus propios candidatos y no se agrupa
+            try:
+                pelicula, recomendaciones = await self._en_modelo(
+                    self.recomendador.recomendar_peliculas, titulo, num_recomendaciones, **filtros
+                )
+            except ValueError as error:
+                raise ErrorPeticion(400, str(error))
+        else:
+            pelicula, recomendaciones = await self.agrupador.recomendar(titulo, num_recomendaciones)
+        if pelicula is None:
+            raise ErrorPeticion(404, f"no se encontró la película '{titulo}'")
+        return {'pelicula': pelicula, 'recomendaciones': recomendaciones}
+
+    async def _perfil(self, parametros):
+        # Historial en JSON {"titulos": [...], "pesos": [...]} o en la query titulos=a|b|c
+        titulos = _titulos(parametros)
+        pesos = parametros.get('pesos_titulos')
+        if isinstance(pesos, str):
+            pesos = pesos.split(',')
+        vida_media = parametros.get('vida_media')
+        try:
+            pesos = None if pesos in (None, '') else [float(peso) for peso in pesos]
+            vida_media = None if vida_media in (None, '') else float(vida_media)
+        except (TypeError, ValueError):
+            raise ErrorPeticion(400, "'pesos_titulos' y 'vida_media' deben ser numéricos")
+        try:
+            peliculas, recomendaciones = await self._en_modelo(
+                self.recomendador.recomendar_para_perfil, titulos, pesos=pesos,
+                num_recomendaciones=_entero(parametros, 'k', defecto=5), vida_media=vida_media,
+                pesos_campos=_pesos(parametros)
+            )
+        except ValueError as error:
+            raise ErrorPeticion(400, str(error))
+        if peliculas is None:
+            raise ErrorPeticion(404, 'no se encontró ninguna película del historial')
+        return {'historial': peliculas, 'recomendaciones': recomendaciones}
+
+    async def _buscar(self, parametros):
+        titulo = _obligatorio(parametros, 'titulo')
+        limite = _entero(parametros, 'limite', defecto=5)
+        return {'resultados': await self._en_modelo(self.recomendador.buscar_candidatos, titulo, limite)}
+
+    async def _comparar(self, parametros):
+        titulo1 = _obligatorio(parametros, 'titulo1')
+        titulo2 = _obligatorio(parametros, 'titulo2')
+        try:
+            resultado = await self._en_modelo(
+                self.recomendador.comparar_peliculas, titulo1, titulo2, pesos=_pesos(parametros)
+            )
+        except ValueError as error:
+            raise ErrorPeticion(400, str(error))
+        if resultado[0] is None:
+            raise ErrorPeticion(404, 'no se encontró alguna de las películas')
+        pelicula1, pelicula2, comparacion = resultado
+        return {'pelicula1': pelicula1, 'pelicula2': pelicula2, 'comparacion': comparacion}
+
+    async def _comparar_multiples(self, parametros):
+        titulos = _titulos(parametros)
+        if len(titulos) > MAX_COMPARAR:
+            raise ErrorPeticion(400, f"se pueden comparar hasta {MAX_COMPARAR} títulos")
+        try:
+            return await self._en_modelo(self.recomendador.comparar_multiples, titulos, pesos=_pesos(parametros))
+        except ValueError as error:
+            raise ErrorPeticion(400, str(error))
+
+    async def _grupos(self, parametros):
+        # Sin parámetros lista los grupos del catálogo; con titulo, los más cercanos a esa película;
+        # con grupo, sus películas (paginadas) y los grupos más parecidos
+        cantidad = _entero(parametros, 'cantidad', defecto=5)
+        if parametros.get('titulo'):
+            pelicula, grupos = await self._en_modelo(
+                self.recomendador.grupos_de_pelicula, parametros['titulo'], cantidad
+            )
+            if pelicula is None:
+                raise ErrorPeticion(404, f"no se encontró la película '{parametros['titulo']}'")
+            return {'pelicula': pelicula, 'grupos': grupos}
+        grupo = _entero(parametros, 'grupo', minimo=0, maximo=sys.maxsize)
+        if grupo is None:
+            return {'grupos': await self._en_modelo(self.recomendador.listar_grupos)}
+
+        from movie_recommender import _filas_a_dicts
+
+        pagina = _entero(parametros, 'pagina', defecto=0, minimo=0, maximo=sys.maxsize)
+        tamano_pagina = _entero(parametros, 'tamano_pagina', defecto=50, maximo=1000)
+
+        def grupo_y_similares():
+            if grupo >= self.recomendador.contar_grupos():
+                return None
+            total, filas = self.recomendador.peliculas_del_grupo(grupo, pagina, tamano_pagina)
+            return total, _filas_a_dicts(filas), self.recomendador.grupos_similares(grupo, cantidad)
+
+        resultado = await self._en_modelo(grupo_y_similares)
+        if resultado is None:
+            raise ErrorPeticion(404, f"grupo desconocido: {grupo}")
+        total, peliculas, similares = resultado
+        return {'grupo': grupo, 'total': total, 'pagina': pagina, 'peliculas': peliculas, 'similares': similares}
+
+    async def _filtrar(self, parametros):
+        from movie_recommender import _filas_a_dicts
+
+        # Solo se materializa la página pedida (desde 0), con los órdenes de filtrar_pagina
+        pagina = _entero(parametros, 'pagina', defecto=0, minimo=0, maximo=sys.maxsize)
+        tamano_pagina = _entero(parametros, 'tamano_pagina', defecto=50, maximo=1000)
+        ordenar_por = _texto(parametros, 'ordenar_por')
+        if ordenar_por not in (None,) + ORDENES_FILTRO:
+            raise ErrorPeticion(400, f"'ordenar_por' admite {', '.join(ORDENES_FILTRO)}")
+        criterios = {
+            'genero': _texto(parametros, 'genero'),
+            'director': _texto(parametros, 'director'),
+            'pais': _texto(parametros, 'pais'),
+            'anios': _rango(parametros, 'anios', int),
+            'rating': _rango(parametros, 'rating', float),
+            'ordenar_por': ordenar_por,
+            'descendente': _booleano(parametros, 'descendente'),
+        }
+
+        def filtrar():
+            total, filas = self.recomendador.filtrar_pagina(pagina=pagina, tamano_pagina=tamano_pagina, **criterios)
+            return total, _filas_a_dicts(filas)
+
+        total, peliculas = await self._en_modelo(filtrar)
+        return {'total': total, 'pagina': pagina, 'peliculas': peliculas}
+
+    async def _estadisticas(self, parametros):
+        return await self._en_modelo(self.recomendador.obtener_estadisticas)
+
+    async def _metricas(self, parametros):
+        # ?formato=prometheus devuelve las métricas del recomendador en texto para Prometheus
+        if parametros.get('formato') == 'prometheus':
+            return self.recomendador.exportar_metricas('prometheus')
+        return {
+            'pid': os.getpid(),
+            'segundos_activo': round(time.time() - self.inicio, 1),
+            'version_catalogo': self.recomendador.version,
+            'latencias': self.latencias.resumen(),
+            'micro_lotes': self.agrupador.resumen(),
+            'recomendador': self.recomendador.exportar_metricas()
+        }
+
+    async def atender(self, metodo, destino, cuerpo):
+        partes = urlsplit(destino)
+        manejador = self.rutas.get(partes.path)
+        if manejador is None:
+            raise ErrorPeticion(404, f"ruta desconocida: {partes.path}")
+        if metodo not in ('GET', 'POST'):
+            raise ErrorPeticion(405, f"método no permitido: {metodo}")
+
+        parametros = dict(parse_qsl(partes.query))
+        if cuerpo:
+            try:
+                datos = json.loads(cuerpo)
+            except ValueError:
+                raise ErrorPeticion(400, 'el cuerpo no es JSON válido')
+            if not isinstance(datos, dict):
+                raise ErrorPeticion(400, 'el cuerpo debe ser un objeto JSON')
+            parametros.update(datos)
+
+        inicio = time.perf_counter()
+        try:
+            return await manejador(parametros)
+        finally:
+            self.latencias.registrar(partes.path, time.perf_counter() - inicio)
+
+    async def conexion(self, lector, escritor):
+        # HTTP/1.1 mínimo: una petición tras otra sobre la misma conexión mientras el cliente la mantenga
+        try:
+            while True:
+                try:
+                    linea = await lector.readline()
+                    if not linea:
+                        break
+                    metodo, destino, version = linea.decode('latin-1').split()
+                    cabeceras = {}
+                    while True:
+                        linea = await lector.readline()
+                        if linea in (b'\r\n', b'\n', b''):
+                            break
+                        nombre, _, valor = linea.decode('latin-1').partition(':')
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+                    longitud = int(cabeceras.get('content-length') or 0)
+                    if longitud < 0:
+                        raise ValueError(longitud)
+                except ValueError:
+                    await self._responder(escritor, 400, {'error': 'petición HTTP mal formada'}, mantener=False)
+                    break
+
+                if longitud > MAX_CUERPO:
+                    await self._responder(escritor, 413, {'error': 'cuerpo demasiado grande'}, mantener=False)
+                    break
+                cuerpo = await lector.readexactly(longitud) if longitud else b''
+
+                conexion = cabeceras.get('connection', '').lower()
+                mantener = conexion != 'close' if version == 'HTTP/1.1' else conexion == 'keep-alive'
+                try:
+                    estado, respuesta = 200, await self.atender(metodo.upper(), destino, cuerpo)
+                except ErrorPeticion as error:
+                    estado, respuesta = error.estado, {'error': str(error)}
+                except Exception as error:
+                    estado, respuesta = 500, {'error': f"{type(error).__name__}: {error}"}
+                await self._responder(escritor, estado, respuesta, mantener)
+                if not mantener:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    @staticmethod
+    async def _responder(escritor, estado, respuesta, mantener):
+        if isinstance(respuesta, str):
+            tipo, cuerpo = 'text/plain; version=0.0.4', respuesta.encode('utf-8')
+        else:
+            tipo = 'application/json'
+            try:
+                cuerpo = json.dumps(respuesta, ensure_ascii=False, default=_a_json, allow_nan=False)
+            except (TypeError, ValueError) as error:
+                # Una respuesta que no se puede serializar se informa como error y no deja la conexión colgada
+                estado = 500
+                cuerpo = json.dumps({'error': f"respuesta no serializable: {error}"}, ensure_ascii=False)
+            cuerpo = cuerpo.encode('utf-8')
+        cabecera = (
+            f"HTTP/1.1 {estado} {MENSAJES_HTTP.get(estado, '')}\r\n"
+            f"Content-Type: {tipo}; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n"
+        ).encode('latin-1')
+        escritor.write(cabecera + cuerpo)
+        await escritor.drain()
+
+
+async def _servir(opciones, reutilizar_puerto):
+    from cache_resultados import CacheResultados
+    from movie_recommender import RecomendadorPeliculas
+
+    # Con --cache-disco los trabajadores comparten además los resultados ya calculados por los demás
+    cache = False
+    if opciones['cache_capacidad'] > 0:
+        cache = CacheResultados(
+            capacidad=opciones['cache_capacidad'], ttl=opciones['cache_ttl'], ruta_disco=opciones['cache_disco']
+        )
+    # Con los artefactos ya guardados, cada proceso abre el modelo con mmap y las páginas se comparten
+    recomendador = RecomendadorPeliculas(
+        opciones['csv'], num_vecinos=opciones['num_vecinos'], ruta_artefactos=opciones['artefactos'],
+        motor=opciones['motor'], dimension_lsa=opciones['dimension_lsa'],
+        listas_ivf=opciones['listas_ivf'], sondas_ivf=opciones['sondas_ivf'], cache=cache,
+        num_grupos=opciones['num_grupos']
+    )
+    servicio = ServicioRecomendaciones(recomendador, opciones['max_lote'], opciones['espera_maxima'])
+    servidor = await asyncio.start_server(
+        servicio.conexion, opciones['host'], opciones['puerto'], reuse_port=reutilizar_puerto or None
+    )
+    print(f"[{os.getpid()}] escuchando en http://{opciones['host']}:{opciones['puerto']}", flush=True)
+    async with servidor:
+        await servidor.serve_forever()
+
+
+def _proceso_trabajador(opciones, reutilizar_puerto):
+    try:
+        asyncio.run(_servir(opciones, reutilizar_puerto))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servicio HTTP/JSON de recomendaciones de películas')
+    parser.add_argument('--csv', default=os.path.join(DIRECTORIO, 'data', 'movies.csv'))
+    parser.add_argument('--artefactos', default=os.path.join(DIRECTORIO, 'artefactos'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-lote', type=int, default=64)
+    parser.add_argument('--espera-ms', type=float, default=2.0)
+    parser.add_argument('--num-vecinos', type=int, default=None)
+    parser.add_argument('--motor', choices=['tfidf', 'lsa', 'ivf', 'campos'], default='tfidf',
+                        help="con 'campos' las matrices por campo (las que usan los pesos) se ajustan y guardan "
+                             'antes de lanzar los trabajadores')
+    parser.add_argument('--dimension-lsa', type=int, default=128)
+    parser.add_argument('--listas-ivf', type=int, default=None)
+    parser.add_argument('--sondas-ivf', type=int, default=16)
+    parser.add_argument('--num-grupos', type=int, default=None,
+                        help='agrupa el catálogo al construirlo y guarda los grupos con los artefactos')
+    parser.add_argument('--cache-capacidad', type=int, default=1024, help='entradas en memoria por proceso; 0 la desactiva')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='segundos de vida de cada resultado')
+    parser.add_argument('--cache-disco', default=None, help='archivo SQLite compartido por los trabajadores')
+    args = parser.parse_args()
+
+    opciones = {
+        'csv': os.path.abspath(args.csv),
+        'artefactos': os.path.abspath(args.artefactos),
+        'host': args.host,
+        'puerto': args.puerto,
+        'num_vecinos': args.num_vecinos,
+        'motor': args.motor,
+        'dimension_lsa': args.dimension_lsa,
+        'listas_ivf': args.listas_ivf,
+        'sondas_ivf': args.sondas_ivf,
+        'num_grupos': args.num_grupos,
+        'cache_capacidad': args.cache_capacidad,
+        'cache_ttl': args.cache_ttl,
+        'cache_disco': None if args.cache_disco is None else os.path.abspath(args.cache_disco),
+        'max_lote': max(args.max_lote, 1),
+        'espera_maxima': max(args.espera_ms, 0.0) / 1000,
+    }
+
+    if args.workers <= 1:
+        _proceso_trabajador(opciones, False)
+        return
+
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('--workers > 1 necesita SO_REUSEPORT (Linux, macOS o BSD)')
+
+    # El proceso padre construye y guarda los artefactos una sola vez antes de lanzar los trabajadores
+    from movie_recommender import RecomendadorPeliculas
+    RecomendadorPeliculas(
+        opciones['csv'], num_vecinos=opciones['num_vecinos'], ruta_artefactos=opciones['artefactos'],
+        motor=opciones['motor'], dimension_lsa=opciones['dimension_lsa'],
+        listas_ivf=opciones['listas_ivf'], sondas_ivf=opciones['sondas_ivf'], cache=False,
+        num_grupos=opciones['num_grupos']
+    )
+
+    contexto = multiprocessing.get_context('spawn')
+    procesos = [
+        contexto.Process(target=_proceso_trabajador, args=(opciones, True), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for proceso in procesos:
+        proceso.start()
+    try:
+        for proceso in procesos:
+            proceso.join()
+    except KeyboardInterrupt:
+        for proceso in procesos:
+            proceso.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from motores import _seleccionar_top_k
+
+# Arreglos que cada trabajador ve en memoria compartida; se rellenan en _iniciar_trabajador
+_COMPARTIDO = {}
+
+
+def _crear_compartido(arreglo=None, forma=None, tipo=None):
+    # Copia `arreglo` (o reserva forma/tipo vacíos) en un bloque de memoria compartida
+    forma = arreglo.shape if arreglo is not None else forma
+    tipo = np.dtype(arreglo.dtype if arreglo is not None else tipo)
+    bloque = shared_memory.SharedMemory(create=True, size=max(int(np.prod(forma)) * tipo.itemsize, 1))
+    vista = np.ndarray(forma, dtype=tipo, buffer=bloque.buf)
+    if arreglo is not None:
+        vista[...] = arreglo
+    return bloque, vista, (bloque.name, forma, tipo.str)
+
+
+def _abrir_compartido(descripcion):
+    nombre, forma, tipo = descripcion
+    # Los trabajadores comparten el resource_tracker del padre, que es quien borra los bloques
+    bloque = shared_memory.SharedMemory(name=nombre)
+    return bloque, np.ndarray(forma, dtype=np.dtype(tipo), buffer=bloque.buf)
+
+
+def _iniciar_trabajador(descripciones, forma_matriz, k):
+    from scipy import sparse
+
+    vistas = {}
+    for nombre, descripcion in descripciones.items():
+        bloque, vistas[nombre] = _abrir_compartido(descripcion)
+        _COMPARTIDO.setdefault('bloques', []).append(bloque)
+    # Las matrices se arman sobre la memoria compartida sin copiar datos
+    _COMPARTIDO['matriz'] = sparse.csr_matrix(
+        (vistas['datos'], vistas['indices'], vistas['indptr']), shape=forma_matriz, copy=False
+    )
+    _COMPARTIDO['traspuesta'] = sparse.csr_matrix(
+        (vistas['datos_t'], vistas['indices_t'], vistas['indptr_t']), shape=forma_matriz[::-1], copy=False
+    )
+    _COMPARTIDO['k'] = k
+    _COMPARTIDO['salida'] = vistas
+
+
+def _procesar_bloque(limites):
+    # Calcula las filas [inicio, fin) y escribe el resultado directamente en la salida compartida
+    inicio, fin = limites
+    filas = np.arange(inicio, fin)
+    bloque = (_COMPARTIDO['matriz'][filas] @ _COMPARTIDO['traspuesta']).toarray()
+    salida = _COMPARTIDO['salida']
+    k = _COMPARTIDO['k']
+    if k is None:
+        salida['similitud'][inicio:fin] = bloque
+    else:
+        bloque[np.arange(len(filas)), filas] = -np.inf
+        salida['vecinos_indices'][inicio:fin], salida['vecinos_puntuaciones'][inicio:fin] = _seleccionar_top_k(bloque, k)
+    return fin - inicio
+
+
+def calcular_similitud_paralela(matriz, k=None, tamano_bloque=256, procesos=None, progreso=None):
+    # Con k devuelve (indices, puntuaciones) del top-k de cada fila; sin k, la matriz densa N×N.
+    # La matriz TF-IDF y su traspuesta se copian una sola vez a memoria compartida y cada
+    # trabajador escribe su bloque de filas en la salida, también compartida.
+    # `progreso(filas_hechas, filas_totales, eta_segundos)` se llama al terminar cada bloque.
+    matriz = matriz.tocsr()
+    total = matriz.shape[0]
+    procesos = procesos or os.cpu_count() or 1
+
+    traspuesta = matriz.T.tocsr()
+    entradas = {
+        'datos': matriz.data, 'indices': matriz.indices, 'indptr': matriz.indptr,
+        'datos_t': traspuesta.data, 'indices_t': traspuesta.indices, 'indptr_t': traspuesta.indptr,
+    }
+    if k is None:
+        salidas = {'similitud': ((total, total), matriz.dtype)}
+    else:
+        salidas = {'vecinos_indices': ((total, k), np.int32), 'vecinos_puntuaciones': ((total, k), np.float32)}
+
+    bloques = []
+    try:
+        descripciones = {}
+        for nombre, arreglo in entradas.items():
+            bloque, vista, descripciones[nombre] = _crear_compartido(arreglo)
+            bloques.append(bloque)
+        del traspuesta, entradas, vista
+        vistas = {}
+        for nombre, (forma, tipo) in salidas.items():
+            bloque, vistas[nombre], descripciones[nombre] = _crear_compartido(forma=forma, tipo=tipo)
+            bloques.append(bloque)
+
+        tareas = [(inicio, min(inicio + tamano_bloque, total)) for inicio in range(0, total, tamano_bloque)]
+        contexto = multiprocessing.get_context('spawn')
+        inicio_reloj = time.perf_counter()
+        hechas = 0
+        with contexto.Pool(procesos, initializer=_iniciar_trabajador,
+                           initargs=(descripciones, matriz.shape, k)) as pool:
+            for filas in pool.imap_unordered(_procesar_bloque, tareas):
+                hechas += filas
+                if progreso is not None:
+                    transcurrido = time.perf_counter() - inicio_reloj
+                    progreso(hechas, total, transcurrido / hechas * (total - hechas))
+
+        resultado = tuple(np.array(vista) for vista in vistas.values())
+        return resultado[0] if k is None else resultado
+    finally:
+        # Las vistas deben soltarse antes de cerrar los bloques
+        vistas = vista = None
+        for bloque in bloques:
+            try:
+                bloque.close()
+            except BufferError:
+                pass
+            bloque.unlink()